@@ -2,6 +2,7 @@ from datetime import datetime
 from typing import Union, Any, List, Tuple
 from typing_extensions import Self
 
+from sqlalchemy import UniqueConstraint
 from sqlmodel import SQLModel, Field, Relationship
 from pydantic import BaseModel, model_validator
 
@@ -48,6 +49,7 @@ class ProductBase(SQLModel):
     unit_size: float | None
     is_variable_weight: bool = False
     is_pack: bool = False
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 
 class PriceHistoryBase(SQLModel):
@@ -97,6 +99,8 @@ class WrongMatchReport(SQLModel, table=True):
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     status: str = Field(default="pending")  # pending, reviewed, rejected
     notes: str | None = None
+    # Keyed hash of the reporting client, see `app.shared.aliases.client_source`
+    source: str | None = None
 
 
 class WrongNutritionReport(SQLModel, table=True):
@@ -110,6 +114,26 @@ class WrongNutritionReport(SQLModel, table=True):
     notes: str | None = None
 
 
+class MatchAlias(SQLModel, table=True):
+    id: int = Field(default=None, primary_key=True)
+    name: str = Field(index=True, unique=True)  # normalized ticket line name
+    product_id: str = Field(foreign_key="product.id")
+    confirmations: int = Field(default=0)  # sources confirming product_id
+    status: str = Field(default="pending")  # pending, reviewed, rejected
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+
+
+class MatchConfirmation(SQLModel, table=True):
+    __table_args__ = (UniqueConstraint("name", "source"),)
+
+    id: int = Field(default=None, primary_key=True)
+    name: str = Field(index=True)  # normalized ticket line name
+    product_id: str = Field(foreign_key="product.id")
+    source: str  # hashed client address, one confirmation per name
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
 class Product(ProductBase, table=True):
     category: Category = Relationship(back_populates="products")
     images: List[ProductImage] = Relationship(
@@ -220,6 +244,27 @@ class ProductMatch(BaseModel):
     product: ProductPublic
 
 
+MAX_BATCH_PRODUCTS = 500
+
+
+class ProductBatchRequest(BaseModel):
+    ids: List[str] = []
+    eans: List[str] = []
+
+    @model_validator(mode="after")
+    def check_size(self) -> Self:
+        if len(self.ids) + len(self.eans) > MAX_BATCH_PRODUCTS:
+            raise ValueError(f"At most {MAX_BATCH_PRODUCTS} ids and EANs per batch")
+        return self
+
+
+class ProductBatchResponse(BaseModel):
+    # Found products, the requested ids first then the EANs, in request order
+    products: List[ProductPublic]
+    missing_ids: List[str] = []
+    missing_eans: List[str] = []
+
+
 class ExtractedTicketItem(BaseModel):
     name: str
     quantity: float = 1.0
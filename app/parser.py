@@ -3,7 +3,9 @@ import time
 from datetime import datetime
 
 from app.models import Category, Product, ProductImage, PriceHistory
+from app.shared.fulltext import index_products
 from loguru import logger
+from sqlalchemy import update
 from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select
 from tenacity import retry, stop_after_attempt, wait_fixed, retry_if_exception_type
@@ -185,13 +187,27 @@ async def parse_category_products(
                         )
                     )
 
-                for key, value in product.dict().items():
-                    setattr(db_product, key, value)
+                changed = False
+                for key, value in product.dict(exclude={"updated_at"}).items():
+                    if getattr(db_product, key) != value:
+                        setattr(db_product, key, value)
+                        changed = True
+                if changed:
+                    # Lets catalog reloads only fetch what changed
+                    db_product.updated_at = datetime.utcnow()
                 db_session.commit()
             except Exception as e:
                 logger.error(f"Error updating product {product.id}: {str(e)}")
                 db_session.rollback()
 
+        index_products(
+            db_session,
+            Product.id.in_(  # type: ignore
+                [product.id for product in new_products + updated_products]
+            ),
+        )
+        db_session.commit()
+
     return len(new_products), len(updated_products)
 
 
@@ -202,6 +218,7 @@ async def parse_mercadona(engine, max_requests_per_second, skip_existing_product
         categories = [
             category async for category in parse_categories(session, rate_limiter)
         ]
+        renamed_categories = []
         with Session(engine) as db_session:
             for category in categories:
                 existing_category = db_session.exec(
@@ -211,11 +228,28 @@ async def parse_mercadona(engine, max_requests_per_second, skip_existing_product
                     logger.info(
                         f"Updating existing category: ({category.id}) {category.name}"
                     )
+                    if (existing_category.name, existing_category.parent_id) != (
+                        category.name,
+                        category.parent_id,
+                    ):
+                        # Products embed their category, mark them as changed
+                        db_session.exec(
+                            update(Product)
+                            .where(Product.category_id == category.id)
+                            .values(updated_at=datetime.utcnow())
+                        )
+                        renamed_categories.append(category.id)
                     existing_category.name = category.name
                     existing_category.parent_id = category.parent_id
                 else:
                     logger.info(f"Adding new category: {category.name}")
                     db_session.add(category)
+            db_session.flush()
+            # Category names are part of the full-text index of their products
+            index_products(
+                db_session,
+                Product.category_id.in_(renamed_categories),  # type: ignore
+            )
             db_session.commit()
 
         tasks = []
@@ -1,25 +1,79 @@
-from fastapi import APIRouter, Depends
+import bisect
+from typing import List, NamedTuple, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from pydantic_core import to_json
 from sqlmodel import Session, select
 from app.database import get_session
 from app.models import Category
 from app.shared.cache import cache
+from app.shared.http_cache import conditional_response, content_version
+from app.shared.pagination import MAX_PAGE_SIZE, decode_cursor, next_page_headers
 
 router = APIRouter(prefix="/categories", tags=["categories"])
 
 
+class CategoryListing(NamedTuple):
+    """Categories ordered by id, with their ids and the version of the list."""
+
+    categories: List[Category]
+    ids: List[int]
+    version: str
+
+
+def load_category_listing(session: Session) -> Optional[CategoryListing]:
+    categories = list(
+        session.exec(select(Category).order_by(Category.id)).all()  # type: ignore
+    )
+    if not categories:
+        return None
+    return CategoryListing(
+        categories,
+        [category.id for category in categories],
+        content_version(to_json([(c.id, c.name, c.parent_id) for c in categories])),
+    )
+
+
+def get_category_listing(session: Session) -> CategoryListing:
+    """Cached categories, empty before the first crawl."""
+    listing = cache.get_or_load(
+        "all_categories", lambda: load_category_listing(session)
+    )
+    return listing or CategoryListing([], [], content_version(b"[]"))
+
+
 @router.get("/")
 def get_categories(
-    skip: int = 0, limit: int = 100, session: Session = Depends(get_session)
+    request: Request,
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(
+        default=None, description="X-Next-Cursor of the previous page"
+    ),
+    session: Session = Depends(get_session),
 ):
-    categories = session.exec(select(Category).offset(skip).limit(limit)).all()
-    return categories
-
+    listing = get_category_listing(session)
+    if cursor is not None:
+        if skip:
+            raise HTTPException(status_code=400, detail="Use either skip or cursor")
+        (after,) = decode_cursor(cursor, "id", (int,))
+        start = bisect.bisect_right(listing.ids, after)
+    else:
+        start = skip
+    categories = listing.categories[start : start + limit]
+    next_key = (
+        (categories[-1].id,)
+        if categories and start + limit < len(listing.categories)
+        else None
+    )
+    # Validated by the categories themselves, 304s are served from the cache
+    return conditional_response(
+        request,
+        listing.version,
+        lambda: to_json(categories),
+        headers=next_page_headers(request, "id", next_key),
+    )
 
-def get_all_categories(session: Session):
-    cached_categories = cache.get("all_categories")
-    if cached_categories:
-        return cached_categories
 
-    categories = session.exec(select(Category)).all()
-    cache.set("all_categories", categories)
-    return categories
+def get_all_categories(session: Session) -> List[Category]:
+    return get_category_listing(session).categories
@@ -0,0 +1,25 @@
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from app.shared.cache import cache, products_ready
+from app.shared.catalog import memory_report
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("/")
+def liveness():
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+def readiness():
+    """Ready once the product catalog is loaded, so no request pays for it."""
+    if not products_ready.is_set():
+        return JSONResponse(
+            status_code=503, content={"status": "loading", "cache": cache.stats()}
+        )
+    return {
+        "status": "ready",
+        "cache": cache.stats(),
+        "memory": memory_report(cache.peek("all_products")),
+    }
@@ -1,10 +1,53 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+from datetime import datetime
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic_core import to_json
 from sqlmodel import Session
 from app.database import get_session
-from app.models import ProductMatch, ProductPublic
-from app.worker import find_closest_products_with_preload
-from app.shared.cache import get_all_products
-from typing import List
+from app.models import (
+    ProductBatchRequest,
+    ProductBatchResponse,
+    ProductMatch,
+    ProductPublic,
+)
+from app.shared.cache import cache, get_all_products, load_products_page
+from app.shared.catalog import CatalogSnapshot
+from app.shared.export import (
+    compressed,
+    database_lines,
+    export_encoding,
+    snapshot_lines,
+    utc_naive,
+)
+from app.shared.fulltext import search_product_ids
+from app.shared.http_cache import (
+    catalog_response,
+    conditional_response,
+    content_version,
+)
+from app.shared.matching import (
+    MATCHER_BACKEND,
+    MatchEngineName,
+    find_closest_products,
+)
+from app.shared.pagination import (
+    MAX_PAGE_SIZE,
+    PRODUCT_SORT_TYPES,
+    ProductSortField,
+    decode_cursor,
+    next_page_headers,
+)
+from app.shared.search import SearchSortKey, nutrient_ranges, search_index
+from app.shared.projection import (
+    JSONBytesResponse,
+    excluded_fields,
+    json_array,
+    json_response,
+    product_fields,
+    product_json,
+)
+from typing import List, Literal, Optional
 from loguru import logger
 
 router = APIRouter(prefix="/products", tags=["products"])
@@ -12,10 +55,55 @@ router = APIRouter(prefix="/products", tags=["products"])
 
 @router.get("/", response_model=List[ProductPublic])
 def get_products(
-    skip: int = 0, limit: int = 100, session: Session = Depends(get_session)
+    request: Request,
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    sort: Optional[ProductSortField] = Query(
+        default=None, description="Page by this field then id, with cursors"
+    ),
+    cursor: Optional[str] = Query(
+        default=None, description="X-Next-Cursor of the previous page"
+    ),
+    fields: List[str] = Depends(product_fields),
+    session: Session = Depends(get_session),
 ):
-    products = get_all_products(session)[skip : skip + limit]
-    return [ProductPublic.model_validate(product) for product in products]
+    if sort is None and cursor is None:
+        products = get_all_products(session)
+        return catalog_response(
+            request,
+            products,
+            lambda: json_array(
+                product_json(products, position, fields)
+                for position in range(len(products))[skip : skip + limit]
+            ),
+        )
+    if skip:
+        raise HTTPException(status_code=400, detail="Use either skip or cursor")
+
+    sort = sort or "id"
+    after = (
+        None
+        if cursor is None
+        else decode_cursor(cursor, sort, (PRODUCT_SORT_TYPES[sort], str))
+    )
+    products = cache.peek("all_products")
+    if products is None:
+        # The catalog is not loaded yet, read only this page from the database
+        page = CatalogSnapshot(load_products_page(session, sort, after, limit + 1))
+        positions, next_key = page.page(sort, None, limit)
+        return JSONBytesResponse(
+            json_array(to_json(page.row(position, fields)) for position in positions),
+            headers=next_page_headers(request, sort, next_key),
+        )
+    positions, next_key = products.page(sort, after, limit)
+    return catalog_response(
+        request,
+        products,
+        lambda: json_array(
+            product_json(products, position, fields) for position in positions
+        ),
+        headers=next_page_headers(request, sort, next_key),
+    )
 
 
 @router.get("/closest", response_model=List[ProductMatch])
@@ -24,6 +112,8 @@ async def get_closest_product(
     unit_price: float | None = None,
     max_results: int = Query(default=10, le=100),
     threshold: int = Query(default=60, ge=0, le=100),
+    engine: MatchEngineName = "fuzzy",
+    fields: List[str] = Depends(product_fields),
     session: Session = Depends(get_session),
 ):
     if name is None and unit_price is None:
@@ -33,18 +123,19 @@ async def get_closest_product(
         )
 
     logger.info(
-        f"Enqueueing product matching task for name='{name}', price={unit_price}"
-    )
-
-    # Use the task directly from the worker
-    task = find_closest_products_with_preload.delay(
-        item_name=name,
-        item_price=unit_price,
-        threshold=threshold,
+        f"Matching products on {MATCHER_BACKEND} with {engine}"
+        f" for name='{name}', price={unit_price}"
     )
 
     try:
-        matches = task.get(timeout=10)  # Wait for up to 10 seconds for the result
+        matches = await find_closest_products(
+            session,
+            item_name=name,
+            item_price=unit_price,
+            threshold=threshold,
+            max_matches=max_results,
+            engine=engine,
+        )
     except Exception as e:
         logger.error(f"Error getting task result: {str(e)}")
         raise HTTPException(status_code=500, detail="Error processing product matching")
@@ -56,16 +147,172 @@ async def get_closest_product(
     logger.info(
         f"Found {len(matches)} matches for query: name='{name}', price={unit_price}"
     )
-    return matches[:max_results]
+    return json_response(
+        [
+            match.model_dump(exclude={"product": excluded_fields(fields)})
+            for match in matches
+        ]
+    )
 
 
-@router.get("/{product_id}", response_model=ProductPublic)
-def get_product(product_id: str, session: Session = Depends(get_session)):
+@router.get("/search", response_model=List[ProductPublic])
+def search_products(
+    request: Request,
+    category_id: List[int] = Query(
+        default=[], description="Categories, with their subcategories"
+    ),
+    is_food: Optional[bool] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    nutrient: List[str] = Query(
+        default=[], description="Nutrient conditions such as protein>=10"
+    ),
+    q: Optional[str] = Query(
+        default=None, description="Full-text query, every word matching as a prefix"
+    ),
+    sort: Optional[SearchSortKey] = Query(
+        default=None, description="Relevance with q, else price by default"
+    ),
+    order: Literal["asc", "desc"] = "asc",
+    skip: int = Query(default=0, ge=0),
+    limit: int = Query(default=100, ge=1, le=MAX_PAGE_SIZE),
+    fields: List[str] = Depends(product_fields),
+    session: Session = Depends(get_session),
+):
+    if sort is None and q is None:
+        sort = "price"
+    ranges = nutrient_ranges(nutrient)
+    if min_price is not None or max_price is not None:
+        ranges["price"] = (min_price, max_price)
+
+    products = get_all_products(session)
+    matches = None
+    if q is not None:
+        # Only the first page of matches is needed when nothing else applies
+        filtered = sort or ranges or category_id or is_food is not None
+        matches = [
+            position
+            for position in map(
+                products.find,
+                search_product_ids(
+                    session, q, limit=None if filtered else skip + limit
+                ),
+            )
+            if position is not None
+        ]
+    positions = search_index(products).search(
+        ranges,
+        category_ids=category_id,
+        is_food=is_food,
+        sort=sort,
+        descending=order == "desc",
+        skip=skip,
+        limit=limit,
+        matches=matches,
+    )
+
+    def render() -> bytes:
+        return json_array(
+            product_json(products, position, fields) for position in positions
+        )
+
+    if q is not None:
+        # Full-text matches come from the database, not from the snapshot
+        content = render()
+        return conditional_response(request, content_version(content), lambda: content)
+    return catalog_response(request, products, render)
+
+
+@router.get("/export")
+def export_products(
+    request: Request,
+    since: Optional[datetime] = Query(
+        default=None, description="Only products updated after this time"
+    ),
+    fields: List[str] = Depends(product_fields),
+    session: Session = Depends(get_session),
+):
+    """
+    Every product as NDJSON, one object per line ordered by id, compressed as
+    negotiated by `Accept-Encoding`.
+    """
+    encoding = export_encoding(request.headers.get("accept-encoding", ""))
+    if since is not None:
+        since = utc_naive(since)
+    products = cache.peek("all_products")
+    lines = (
+        database_lines(session.get_bind(), fields, since)
+        if products is None
+        else snapshot_lines(products, fields, since)
+    )
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
+    return StreamingResponse(
+        compressed(lines, encoding),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
+
+
+@router.post("/batch", response_model=ProductBatchResponse)
+def get_products_batch(
+    request: ProductBatchRequest,
+    fields: List[str] = Depends(product_fields),
+    session: Session = Depends(get_session),
+):
+    products = get_all_products(session)
+    found: List[bytes] = []
+    missing_ids: List[str] = []
+    missing_eans: List[str] = []
+    for keys, find, missing in (
+        (request.ids, products.find, missing_ids),
+        (request.eans, products.find_ean, missing_eans),
+    ):
+        for key in keys:
+            position = find(key)
+            if position is None:
+                missing.append(key)
+            else:
+                found.append(product_json(products, position, fields))
+    return JSONBytesResponse(
+        b'{"products":'
+        + json_array(found)
+        + b',"missing_ids":'
+        + to_json(missing_ids)
+        + b',"missing_eans":'
+        + to_json(missing_eans)
+        + b"}"
+    )
+
+
+@router.get("/ean/{ean}", response_model=ProductPublic)
+def get_product_by_ean(
+    ean: str,
+    request: Request,
+    fields: List[str] = Depends(product_fields),
+    session: Session = Depends(get_session),
+):
     products = get_all_products(session)
-    result = next(
-        iter([product for product in products if product.id == product_id]), None
+    position = products.find_ean(ean)
+    if position is None:
+        raise HTTPException(status_code=404, detail="Product not found")
+    return catalog_response(
+        request, products, lambda: product_json(products, position, fields)
     )
-    if result is None:
+
+
+@router.get("/{product_id}", response_model=ProductPublic)
+def get_product(
+    product_id: str,
+    request: Request,
+    fields: List[str] = Depends(product_fields),
+    session: Session = Depends(get_session),
+):
+    products = get_all_products(session)
+    position = products.find(product_id)
+    if position is None:
         raise HTTPException(status_code=404, detail="Product not found")
-    product = result
-    return ProductPublic.model_validate(product)
+    return catalog_response(
+        request, products, lambda: product_json(products, position, fields)
+    )
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel
-from app.worker import process_wrong_match_report, process_wrong_nutrition_report
+from app.celery_config import celery_app
+from app.shared.aliases import client_source
 from loguru import logger
 
 router = APIRouter(prefix="/reports", tags=["reports"])
@@ -17,13 +18,22 @@ class WrongNutritionReportRequest(BaseModel):
     nutrition_id: int
 
 
+class ConfirmedMatchRequest(BaseModel):
+    original_name: str
+    product_id: str
+
+
 @router.post("/wrong-match")
-async def report_wrong_match(report: WrongMatchReportRequest):
+async def report_wrong_match(report: WrongMatchReportRequest, request: Request):
     try:
-        process_wrong_match_report.delay(
-            original_name=report.original_name,
-            original_price=report.original_price,
-            wrong_match_id=report.wrong_match_id,
+        celery_app.send_task(
+            "app.worker.process_wrong_match_report",
+            kwargs=dict(
+                original_name=report.original_name,
+                original_price=report.original_price,
+                wrong_match_id=report.wrong_match_id,
+                source=client_source(request),
+            ),
         )
         return {"status": "Report submitted successfully"}
     except Exception as e:
@@ -34,10 +44,29 @@ async def report_wrong_match(report: WrongMatchReportRequest):
 @router.post("/wrong-nutrition")
 async def report_wrong_nutrition(report: WrongNutritionReportRequest):
     try:
-        process_wrong_nutrition_report.delay(
-            product_id=report.product_id, nutrition_id=report.nutrition_id
+        celery_app.send_task(
+            "app.worker.process_wrong_nutrition_report",
+            kwargs=dict(product_id=report.product_id, nutrition_id=report.nutrition_id),
         )
         return {"status": "Report submitted successfully"}
     except Exception as e:
         logger.error(f"Error submitting wrong nutrition report: {str(e)}")
         raise HTTPException(status_code=500, detail="Error submitting report")
+
+
+@router.post("/confirmed-match")
+async def report_confirmed_match(report: ConfirmedMatchRequest, request: Request):
+    try:
+        celery_app.send_task(
+            "app.worker.process_confirmed_match",
+            kwargs=dict(
+                original_name=report.original_name,
+                product_id=report.product_id,
+                # Confirmations only count once per client
+                source=client_source(request),
+            ),
+        )
+        return {"status": "Report submitted successfully"}
+    except Exception as e:
+        logger.error(f"Error submitting confirmed match: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error submitting report")
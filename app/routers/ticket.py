@@ -1,13 +1,10 @@
-from celery import group
-from celery.result import allow_join_result
-
 import os
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlmodel import Session
 from loguru import logger
 from pathlib import Path
 from tempfile import TemporaryDirectory
-from typing import Union, Optional
+from typing import List, Union, Optional
 import requests
 import shutil
 
@@ -18,9 +15,9 @@ from app.models import (
     ItemStats,
     ExtractedTicketInfo,
     ProductPublic,
-    ProductMatch,
 )
-from app.worker import find_closest_products_with_preload
+from app.shared.matching import MatchEngineName, find_closest_products_batch
+from app.shared.projection import excluded_fields, json_response, product_fields
 from app.ai.ticket import AIInformationExtractor
 
 router = APIRouter(prefix="/ticket", tags=["ticket"])
@@ -94,6 +91,8 @@ def calculate_item_stats(
 async def process_ticket(
     file: Union[UploadFile, None] = File(None),
     image_url: Union[str, None] = Form(None),
+    engine: MatchEngineName = Form("fuzzy"),
+    fields: List[str] = Depends(product_fields),
     session: Session = Depends(get_session),
 ):
     if file is None and image_url is None:
@@ -138,29 +137,19 @@ async def process_ticket(
             ti.ticket_id = ticket.id
             session.add(ti)
 
-        # Create a group of tasks for product matching
-        product_tasks = group(
-            [
-                find_closest_products_with_preload.s(
-                    item_name=item.name,
-                    item_price=item.unit_price,
-                )
-                for item in ticket_info.items
-            ]
-        )
-        group_result = product_tasks.apply_async()
-
-        # Wait for all tasks to complete with timeout
-        with allow_join_result():
-            try:
-                results = group_result.get(
-                    timeout=20
-                )  # 20 second timeout for entire group
-            except Exception as e:
-                logger.error(f"Error waiting for product matching tasks: {str(e)}")
-                raise HTTPException(
-                    status_code=500, detail="Timeout or error while matching products"
-                )
+        # Match all ticket items against the catalog in a single call
+        try:
+            results = await find_closest_products_batch(
+                session,
+                items=[(item.name, item.unit_price) for item in ticket_info.items],
+                max_matches=1,
+                engine=engine,
+            )
+        except Exception as e:
+            logger.error(f"Error waiting for product matching task: {str(e)}")
+            raise HTTPException(
+                status_code=500, detail="Timeout or error while matching products"
+            )
 
         # Process results and create ticket items
         ticket_items = []
@@ -169,7 +158,7 @@ async def process_ticket(
                 logger.warning(f"No match found for product '{item.name}'")
                 continue
 
-            product_match = ProductMatch.model_validate(result[0])
+            product_match = result[0]
             product = product_match.product
             logger.info(
                 f"Best match for '{item.name}': {product.name} (Score: {product_match.score:.2f})"
@@ -189,7 +178,11 @@ async def process_ticket(
             )
             ticket_items.append(ticket_item)
 
-        return TicketStats(items=ticket_items)
+        return json_response(
+            TicketStats(items=ticket_items).model_dump(
+                exclude={"items": {"__all__": {"product": excluded_fields(fields)}}}
+            )
+        )
 
     except Exception as e:
         logger.error(f"Error processing ticket: {str(e)}")
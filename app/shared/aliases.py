@@ -0,0 +1,229 @@
+import functools
+import hashlib
+import hmac
+import ipaddress
+import os
+import secrets
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, Set, Tuple
+
+from fastapi import Request
+from loguru import logger
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.models import MatchAlias, MatchConfirmation, WrongMatchReport
+from app.shared.index_refresh import PeriodicRefresh
+from app.shared.product_matcher import ProductIndex, match_cache, normalize_name
+
+# Seconds between incremental refreshes of the alias table from the database
+ALIAS_REFRESH_INTERVAL = float(os.getenv("ALIAS_REFRESH_INTERVAL", "60"))
+# Distinct sources that must confirm a product before its alias is used,
+# reviewed aliases are used regardless
+ALIAS_MIN_CONFIRMATIONS = int(os.getenv("ALIAS_MIN_CONFIRMATIONS", "3"))
+# Key of the client hashes, so stored sources can't be reversed by hashing
+# every IP address; must be shared by all the API processes
+ALIAS_SOURCE_SECRET = os.getenv("ALIAS_SOURCE_SECRET", "")
+# Comma separated addresses or networks of the reverse proxies whose
+# X-Forwarded-For header is trusted
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(proxy.strip())
+    for proxy in os.getenv("TRUSTED_PROXIES", "127.0.0.1,::1").split(",")
+    if proxy.strip()
+]
+
+
+def is_trusted_proxy(address: str) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in TRUSTED_PROXIES)
+
+
+def client_address(request: Request) -> str:
+    """
+    Address of the client of a request: the last X-Forwarded-For hop not added
+    by a trusted proxy, when the request comes from one.
+    """
+    address = request.client.host if request.client else ""
+    if not is_trusted_proxy(address):
+        return address
+    hops = [
+        hop.strip()
+        for header in request.headers.getlist("x-forwarded-for")
+        for hop in header.split(",")
+        if hop.strip()
+    ]
+    while hops and is_trusted_proxy(address):
+        address = hops.pop()
+    return address
+
+
+@functools.cache
+def source_key() -> bytes:
+    if ALIAS_SOURCE_SECRET:
+        return ALIAS_SOURCE_SECRET.encode()
+    logger.warning(
+        "ALIAS_SOURCE_SECRET is not set, clients reporting through several API"
+        " processes or restarts count as several sources"
+    )
+    return secrets.token_bytes(32)
+
+
+def client_source(request: Request) -> str:
+    """Keyed hash of the client of a request, to count its reports once."""
+    return hmac.new(
+        source_key(), client_address(request).encode(), hashlib.sha256
+    ).hexdigest()[:32]
+
+
+def is_trusted(alias: MatchAlias) -> bool:
+    """Whether an alias is reviewed, or confirmed by enough distinct sources."""
+    return alias.status == "reviewed" or (
+        alias.status == "pending" and alias.confirmations >= ALIAS_MIN_CONFIRMATIONS
+    )
+
+
+def confirm_alias(
+    session: Session, original_name: str, product_id: str, source: str
+) -> MatchAlias:
+    """
+    Record that `source` confirmed `product_id` for a ticket line name.
+
+    Each source has a single confirmation per name, its latest. The alias of
+    a pending name follows the product with the most confirmations, reviewed
+    and rejected aliases keep their product.
+    """
+    name = normalize_name(original_name)
+    confirmation = session.exec(
+        select(MatchConfirmation).where(
+            MatchConfirmation.name == name, MatchConfirmation.source == source
+        )
+    ).first()
+    if confirmation is None:
+        confirmation = MatchConfirmation(
+            name=name, product_id=product_id, source=source
+        )
+    else:
+        confirmation.product_id = product_id
+        confirmation.created_at = datetime.utcnow()
+    session.add(confirmation)
+    session.flush()
+
+    counts = dict(
+        session.exec(
+            select(MatchConfirmation.product_id, func.count())
+            .where(MatchConfirmation.name == name)
+            .group_by(MatchConfirmation.product_id)
+        ).all()
+    )
+    alias = session.exec(select(MatchAlias).where(MatchAlias.name == name)).first()
+    if alias is None:
+        alias = MatchAlias(name=name, product_id=product_id)
+    if alias.status == "pending":
+        # Ties keep the current product
+        alias.product_id = max(counts, key=lambda p: (counts[p], p == alias.product_id))
+    alias.confirmations = counts.get(alias.product_id, 0)
+    alias.updated_at = datetime.utcnow()
+    session.add(alias)
+    session.commit()
+    session.refresh(alias)
+    return alias
+
+
+class AliasTable(PeriodicRefresh):
+    """
+    In-memory view of the learned ticket line aliases.
+
+    Maps normalized ticket line names to the product confirmed for them, and to
+    the products reported as wrong matches for them. It is checked before any
+    fuzzy matching. Only trusted aliases are used, see `is_trusted`, and they
+    are refreshed incrementally: only aliases updated since the previous
+    refresh are loaded. Wrong matches are used once reviewed, or reported by
+    `ALIAS_MIN_CONFIRMATIONS` distinct sources, and are reloaded whole on every
+    refresh, as reports change status once reviewed.
+    """
+
+    def __init__(self, refresh_interval: float = ALIAS_REFRESH_INTERVAL):
+        super().__init__(refresh_interval)
+        self.aliases: dict[str, str] = {}
+        self.negatives: dict[str, Set[str]] = {}
+        self.last_alias_update = datetime.min
+        self.lock = threading.Lock()
+
+    def refresh(self, session: Session) -> int:
+        """Load the changes since the previous refresh, returns how many."""
+        with self.lock:
+            aliases = session.exec(
+                select(MatchAlias).where(
+                    MatchAlias.updated_at >= self.last_alias_update
+                )
+            ).all()
+            reports = session.exec(
+                select(
+                    WrongMatchReport.original_name,
+                    WrongMatchReport.wrong_match_id,
+                    WrongMatchReport.status,
+                    WrongMatchReport.source,
+                )
+                .where(WrongMatchReport.status != "rejected")
+                .distinct()
+            ).all()
+
+            changes = 0
+            for alias in aliases:
+                if not is_trusted(alias):
+                    changes += self.aliases.pop(alias.name, None) is not None
+                elif self.aliases.get(alias.name) != alias.product_id:
+                    self.aliases[alias.name] = alias.product_id
+                    changes += 1
+                self.last_alias_update = max(self.last_alias_update, alias.updated_at)
+
+            # Sources of every pending wrong match, reviewed ones are trusted
+            sources: dict[Tuple[str, str], Set[Optional[str]]] = defaultdict(set)
+            negatives: dict[str, Set[str]] = defaultdict(set)
+            for original_name, wrong_match_id, status, source in reports:
+                name = normalize_name(original_name)
+                if status == "reviewed":
+                    negatives[name].add(wrong_match_id)
+                else:
+                    sources[name, wrong_match_id].add(source)
+            for (name, wrong_match_id), reporters in sources.items():
+                if len(reporters) >= ALIAS_MIN_CONFIRMATIONS:
+                    negatives[name].add(wrong_match_id)
+            changes += sum(
+                len(negatives.get(name, set()) ^ self.negatives.get(name, set()))
+                for name in negatives.keys() | self.negatives.keys()
+            )
+            self.negatives = dict(negatives)
+            self.refreshed_at = time.monotonic()
+
+        if changes:
+            # Cached results may contradict the new aliases
+            match_cache.clear()
+            logger.info(f"Loaded {changes} alias changes")
+        return changes
+
+    def resolve(
+        self, index: ProductIndex, item_name: Optional[str]
+    ) -> Tuple[Optional[int], Set[int]]:
+        """
+        Catalog position of the product aliased to `item_name`, if any, and the
+        positions of the products reported as wrong matches for it.
+        """
+        if item_name is None:
+            return None, set()
+        name = normalize_name(item_name)
+        excluded = {
+            index.positions[product_id]
+            for product_id in self.negatives.get(name, ())
+            if product_id in index.positions
+        }
+        position = index.positions.get(self.aliases.get(name, ""))
+        if position in excluded:
+            position = None
+        return position, excluded
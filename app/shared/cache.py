@@ -1,55 +1,332 @@
-from datetime import datetime, timedelta
-from typing import Any, List
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Hashable, List, Optional, Tuple
 
 from loguru import logger
-from sqlmodel import select, Session
+from sqlmodel import col, select, Session
+from sqlalchemy import and_, func, or_
 from sqlalchemy.orm import joinedload
 
+from app.database import get_engine
 from app.models import Product
+from app.shared.search import search_index
+from app.shared.catalog import (
+    CatalogSnapshot,
+    from_microseconds,
+    memory_report,
+    open_snapshot,
+    write_snapshot,
+)
+
+# Maximum number of entries kept by the shared cache
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "128"))
+# Maximum bytes of pre-serialized product JSON kept by the JSON cache
+JSON_CACHE_BYTES = int(os.getenv("JSON_CACHE_BYTES", str(64 * 1024 * 1024)))
 
 
 class Cache:
-    def __init__(self, timeout: int = 3600):
-        self.data: dict[str, Any] = {}
+    """
+    Bounded approximate LRU cache with per-key TTL, shared by the API threads.
+
+    Entries are immutable (value, expiry, weight) tuples in an ordered dict.
+    Hits are lock-free: a dict read, and a flag set in `referenced`. Every
+    change to the dict is serialized by a lock, and evictions give the oldest
+    entries flagged since their last chance a second one, moving them to the
+    most recent end (the CLOCK algorithm). The size is bounded by `maxsize`,
+    counted in entries or, with a `weigher`, in the weights it returns.
+
+    `get_or_load` loads missing keys once: concurrent callers wait for the
+    first one's load instead of running the same query, and can keep serving
+    expired values while they are refreshed in the background. Counters are
+    updated without locking, so they can undercount under heavy contention.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 3600,
+        maxsize: int = CACHE_MAX_SIZE,
+        weigher: Optional[Callable[[Any], int]] = None,
+    ):
         self.timeout = timeout
+        self.maxsize = maxsize
+        self.weigher = weigher
+        self.data: OrderedDict[Hashable, Tuple[Any, float, int]] = OrderedDict()
+        # Keys hit since they were last inserted or given a second chance
+        self.referenced: set[Hashable] = set()
+        self.weight = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.lock = threading.Lock()
+        self.loading: dict[Hashable, threading.Lock] = {}
+        self.refreshing: set[Hashable] = set()
+
+    def get(self, key: Hashable):
+        entry = self.data.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        value, expires_at, _ = entry
+        if time.monotonic() >= expires_at:
+            self.misses += 1
+            with self.lock:
+                if self.data.get(key) is entry:
+                    self._remove(key)
+                    self.expirations += 1
+            return None
+        self.referenced.add(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Any:
+        """Value of `key`, even if expired, without counting a lookup."""
+        entry = self.data.get(key)
+        return None if entry is None else entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        weight = self.weigher(value) if self.weigher else 1
+        expires_at = time.monotonic() + (self.timeout if ttl is None else ttl)
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+            self.data[key] = (value, expires_at, weight)
+            self.weight += weight
+            self.referenced.discard(key)
+            # Always keep the new entry, even if it is heavier than maxsize
+            chances = len(self.data)
+            while self.weight > self.maxsize and len(self.data) > 1:
+                oldest = next(iter(self.data))
+                if oldest == key or (chances and oldest in self.referenced):
+                    if oldest != key:
+                        self.referenced.discard(oldest)
+                        chances -= 1
+                    self.data.move_to_end(oldest)
+                    continue
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get_or_load(
+        self,
+        key: Hashable,
+        load: Callable[[], Any],
+        ttl: Optional[float] = None,
+        refresh: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        Cached value of `key`, loaded with `load` once for concurrent misses.
+
+        With `refresh`, an expired value is still returned while `refresh`
+        reloads it in a background thread (stale-while-revalidate); the new
+        value is swapped in once loaded. `refresh` must not depend on the
+        caller's resources, like its database session.
+        """
+        if refresh is not None:
+            entry = self.data.get(key)
+            if entry is not None:
+                if time.monotonic() >= entry[1]:
+                    self.stale_hits += 1
+                    self.revalidate(key, refresh, ttl)
+                else:
+                    self.hits += 1
+                return entry[0]
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self.lock:
+            key_lock = self.loading.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another caller may have loaded it while we waited
+            entry = self.data.get(key)
+            if entry is not None and time.monotonic() < entry[1]:
+                return entry[0]
+            value = load()
+            # Empty results, like a catalog before the first crawl, aren't kept
+            if value:
+                self.set(key, value, ttl)
+            return value
 
-    def get(self, key: str):
-        if key in self.data:
-            value, timestamp = self.data[key]
-            if datetime.now() - timestamp < timedelta(seconds=self.timeout):
-                return value
-        return None
+    def revalidate(
+        self, key: Hashable, load: Callable[[], Any], ttl: Optional[float] = None
+    ):
+        """Reload `key` in a background thread, unless already being reloaded."""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
 
-    def set(self, key: str, value: Any):
-        self.data[key] = (value, datetime.now())
+        def run():
+            try:
+                value = load()
+                if value:
+                    self.set(key, value, ttl)
+                    logger.debug(f"Refreshed cache key '{key}'")
+            except Exception as e:
+                # The stale value is still served, the next lookup retries
+                logger.error(f"Error refreshing cache key '{key}': {str(e)}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"cache-refresh-{key}", daemon=True).start()
+
+    def delete(self, key: Hashable):
+        with self.lock:
+            if key in self.data:
+                self._remove(key)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.referenced.clear()
+            self.weight = 0
+
+    def _remove(self, key: Hashable):
+        _, _, weight = self.data.pop(key)
+        self.referenced.discard(key)
+        self.weight -= weight
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self.data),
+            "weight": self.weight,
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+        }
 
 
 cache = Cache()
+# Serialized product JSON by catalog snapshot, field selection and position
+json_cache = Cache(timeout=float("inf"), maxsize=JSON_CACHE_BYTES, weigher=len)
+# Set once the first product catalog is loaded in the cache
+products_ready = threading.Event()
 
 
-def get_all_products(session: Session) -> List[Product]:
-    cached_products = cache.get("all_products")
-    if cached_products:
-        logger.debug("Retrieved products from cache")
-        return cached_products
-
-    logger.debug("Fetching all products from database")
-    products = (
-        session.exec(
-            select(Product).options(
-                joinedload(Product.category),  # type: ignore
-                joinedload(Product.images),  # type: ignore
-                joinedload(Product.nutritional_information),  # type: ignore
-                joinedload(Product.price_history),  # type: ignore
-            )
-        )
-        .unique()
-        .all()
+def _products_query():
+    return select(Product).options(
+        joinedload(Product.category),  # type: ignore
+        joinedload(Product.images),  # type: ignore
+        joinedload(Product.nutritional_information),  # type: ignore
+        joinedload(Product.price_history),  # type: ignore
     )
 
+
+def _detached(session: Session, query) -> List[Product]:
+    products = list(session.exec(query).unique().all())
+
     # Detach products from the session
     for product in products:
         session.expunge(product)
+    return products
+
+
+def load_products(session: Session, since: Optional[datetime] = None) -> List[Product]:
+    """
+    Load detached products with all their relationships, only the ones updated
+    at or after `since` if given.
+    """
+    query = _products_query()
+    if since is not None:
+        query = query.where(Product.updated_at >= since)
+    return _detached(session, query)
+
+
+def load_products_page(
+    session: Session,
+    field: str,
+    after: Optional[Tuple[Any, str]],
+    limit: int,
+    since: Optional[datetime] = None,
+) -> List[Product]:
+    """
+    Load the first `limit` detached products ordered by `field` then id,
+    starting after the sort key `after`, as `CatalogSnapshot.page` does; only
+    the ones updated after `since` if given.
+    """
+    column = getattr(Product, field)
+    query = _products_query().order_by(column, Product.id).limit(max(limit, 0))
+    if since is not None:
+        query = query.where(Product.updated_at > since)
+    if after is not None:
+        value, product_id = after
+        if field == "updated_at":
+            value = from_microseconds(value)
+        query = query.where(
+            or_(column > value, and_(column == value, col(Product.id) > product_id))
+        )
+    return _detached(session, query)
+
+
+def catalog_state(session: Session) -> Tuple[int, Optional[datetime]]:
+    """Product count and latest `updated_at` of the database catalog."""
+    last_updated: Optional[datetime]
+    count, last_updated = session.exec(
+        select(func.count(), func.max(Product.updated_at))
+    ).one()
+    return count, last_updated
+
+
+def load_catalog(session: Session) -> CatalogSnapshot:
+    """
+    Catalog snapshot mapped from the shared snapshot file while it holds the
+    same products as the database, else loaded from the database and written
+    to the file for the other processes.
+    """
+    products = open_snapshot(max_age=cache.timeout)
+    if products is not None and (len(products), products.last_updated) != (
+        catalog_state(session)
+    ):
+        logger.debug("Catalog snapshot is out of date")
+        products = None
+    if products is None:
+        logger.debug("Fetching all products from database")
+        products = CatalogSnapshot(load_products(session))
+        if products:
+            products = write_snapshot(products) or products
+    if products:
+        # Build the lookup indexes before any request needs them
+        products.index("id")
+        products.index("ean")
+        search_index(products)
+        products_ready.set()
+        logger.info(f"Loaded catalog snapshot: {memory_report(products)}")
+    return products
+
+
+def load_all_products() -> CatalogSnapshot:
+    """Load the whole catalog in a session of its own."""
+    with Session(get_engine()) as session:
+        return load_catalog(session)
+
+
+def get_all_products(session: Session) -> CatalogSnapshot:
+    """
+    Cached product catalog, as a compact snapshot. Once expired, the previous
+    catalog keeps being returned while a fresh one is loaded in the background.
+    """
+    return cache.get_or_load(
+        "all_products", lambda: load_catalog(session), refresh=load_all_products
+    )
+
+
+def warm_up():
+    """Load the product catalog in the background, before the first request."""
+
+    def run():
+        try:
+            products = cache.get_or_load("all_products", load_all_products)
+            logger.info(f"Warmed up cache with {len(products)} products")
+        except Exception as e:
+            logger.error(f"Error warming up cache: {str(e)}")
 
-    cache.set("all_products", products)
-    return list(products)
+    threading.Thread(target=run, name="cache-warmup", daemon=True).start()
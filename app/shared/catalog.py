@@ -0,0 +1,745 @@
+"""
+Compact columnar snapshot of the product catalog.
+
+Detached ORM products with their joined images, nutrition and whole price history
+take a few KiB each, in every API and worker process. A snapshot keeps the same
+data as NumPy columns instead: numbers in typed arrays, strings deduplicated in
+a single UTF-8 buffer, and the images and price history of all products in flat
+arrays indexed by per-product offsets. `ProductPublic` models are only built for
+the products actually returned.
+"""
+
+import bisect
+import copy
+import itertools
+import json
+import mmap
+import os
+import resource
+import struct
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Collection, Dict, Iterable, List, Optional, Tuple, Union, cast
+
+import numpy as np
+from loguru import logger
+
+from app.models import (
+    Category,
+    NutritionalInformationBase,
+    ProductPublic,
+    is_food_category,
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+# Product string fields, stored as indices into the snapshot string table
+STRING_FIELDS = [
+    "id",
+    "ean",
+    "slug",
+    "brand",
+    "name",
+    "description",
+    "origin",
+    "packaging",
+    "unit_name",
+]
+IMAGE_URL_FIELDS = ["zoom_url", "regular_url", "thumbnail_url"]
+NUTRIENT_FIELDS = list(NutritionalInformationBase.model_fields)
+PRODUCT_FIELDS = list(ProductPublic.model_fields)
+
+# Plain array attributes of a snapshot, besides the per field ones
+COLUMN_ARRAYS = [
+    "price",
+    "unit_size",
+    "category_id",
+    "flags",
+    "updated_at",
+    "image_offsets",
+    "image_id",
+    "image_perspective",
+    "nutrition_id",
+    "history_offsets",
+    "history_id",
+    "history_price",
+    "history_timestamp",
+]
+
+_serials = itertools.count(1)
+
+# Fields catalog pages can be ordered by, ties broken by id
+SORT_FIELDS = ["id", "name", "price", "updated_at"]
+
+VARIABLE_WEIGHT = 1
+PACK = 2
+
+# Catalog snapshot file shared by the API and worker processes, disabled if empty
+CATALOG_SNAPSHOT_PATH = os.getenv("CATALOG_SNAPSHOT_PATH", "")
+SNAPSHOT_MAGIC = b"MERCACAT"
+SNAPSHOT_VERSION = 1
+# Magic, format version, generation, write time, directory length, data offset
+SNAPSHOT_HEADER = struct.Struct("<8sIQdQQ")
+SNAPSHOT_ALIGNMENT = 64
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+def to_microseconds(value: datetime) -> int:
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_microseconds(value: int) -> datetime:
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class StringTable:
+    """
+    Distinct strings stored once, UTF-8 encoded back to back in one buffer.
+
+    Strings are added while building a snapshot and referenced by index, -1
+    standing for None; `freeze` packs them and drops the deduplication dict.
+    """
+
+    def __init__(self):
+        self.lookup: dict[str, int] = {}
+        self.encoded: List[bytes] = []
+        self.data: Union[bytes, memoryview] = b""
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def add(self, value: Optional[str]) -> int:
+        if value is None:
+            return -1
+        index = self.lookup.get(value)
+        if index is None:
+            index = self.lookup[value] = len(self.encoded)
+            self.encoded.append(value.encode())
+        return index
+
+    def freeze(self):
+        self.offsets = np.zeros(len(self.encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in self.encoded], out=self.offsets[1:])
+        self.data = b"".join(self.encoded)
+        self.lookup, self.encoded = {}, []
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> Optional[str]:
+        if index < 0:
+            return None
+        return str(self.data[self.offsets[index] : self.offsets[index + 1]], "utf-8")
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.data) + self.offsets.nbytes
+
+
+class ProductView:
+    """
+    Attributes of one product of a snapshot, read from its columns.
+
+    Lets a snapshot of changed products patch another snapshot, see
+    `CatalogSnapshot.views`, without keeping any ORM or public model around.
+    """
+
+    __slots__ = ("snapshot", "position")
+
+    def __init__(self, snapshot: "CatalogSnapshot", position: int):
+        self.snapshot = snapshot
+        self.position = position
+
+    def __getattr__(self, field: str) -> Any:
+        if field in ProductView.__slots__:
+            # Not set yet, e.g. while unpickling
+            raise AttributeError(field)
+        snapshot, position = self.snapshot, self.position
+        if field in snapshot.string_columns:
+            return snapshot.strings[int(snapshot.string_columns[field][position])]
+        if field == "price":
+            return float(snapshot.price[position])
+        if field == "unit_size":
+            unit_size = float(snapshot.unit_size[position])
+            return None if np.isnan(unit_size) else unit_size
+        if field == "category_id":
+            return int(snapshot.category_id[position])
+        if field == "updated_at":
+            return from_microseconds(snapshot.updated_at[position])
+        return getattr(snapshot.product(position), field)
+
+
+class CatalogSnapshot:
+    """
+    Read-mostly sequence of the catalog products, stored as columns.
+
+    Indexing materializes `ProductPublic` models on demand. Products can still
+    be replaced or appended, e.g. by `ProductIndex.update`: they are kept as the
+    given objects on top of the columns, changes being few between reloads.
+    Patching with `ProductView`s of a snapshot of the changes keeps them as
+    columns too.
+    """
+
+    def __init__(self, products: Iterable[Any] = ()):
+        self.strings = StringTable()
+        strings: Dict[str, List[int]] = {field: [] for field in STRING_FIELDS}
+        prices, unit_sizes, category_ids, flags, updated_at = [], [], [], [], []
+        self.categories: Dict[int, Dict[str, Any]] = {}
+        image_offsets, image_ids, perspectives = [0], [], []
+        image_urls: Dict[str, List[int]] = {field: [] for field in IMAGE_URL_FIELDS}
+        nutrition_ids = []
+        nutrients: Dict[str, List[float]] = {field: [] for field in NUTRIENT_FIELDS}
+        history_offsets, history_ids, history_prices, history_timestamps = (
+            [0],
+            [],
+            [],
+            [],
+        )
+
+        for product in products:
+            for field in STRING_FIELDS:
+                strings[field].append(self.strings.add(getattr(product, field)))
+            prices.append(product.price)
+            unit_sizes.append(
+                np.nan if product.unit_size is None else product.unit_size
+            )
+            category_ids.append(product.category_id)
+            flags.append(
+                (VARIABLE_WEIGHT if product.is_variable_weight else 0)
+                | (PACK if product.is_pack else 0)
+            )
+            updated_at.append(to_microseconds(product.updated_at))
+            if product.category is not None:
+                self.categories.setdefault(
+                    product.category.id,
+                    {
+                        "name": product.category.name,
+                        "parent_id": product.category.parent_id,
+                        "id": product.category.id,
+                    },
+                )
+
+            for image in product.images:
+                image_ids.append(image.id)
+                perspectives.append(image.perspective)
+                for field in IMAGE_URL_FIELDS:
+                    image_urls[field].append(self.strings.add(getattr(image, field)))
+            image_offsets.append(len(image_ids))
+
+            nutrition = product.nutritional_information
+            nutrition_ids.append(-1 if nutrition is None else nutrition.id)
+            for field in NUTRIENT_FIELDS:
+                value = None if nutrition is None else getattr(nutrition, field)
+                nutrients[field].append(np.nan if value is None else value)
+
+            for entry in product.price_history:
+                history_ids.append(entry.id)
+                history_prices.append(entry.price)
+                history_timestamps.append(to_microseconds(entry.timestamp))
+            history_offsets.append(len(history_ids))
+
+        self.strings.freeze()
+        self.size = len(prices)
+        self.string_columns = {
+            field: np.array(values, dtype=np.int32) for field, values in strings.items()
+        }
+        self.price = np.array(prices, dtype=np.float64)
+        self.unit_size = np.array(unit_sizes, dtype=np.float64)
+        self.category_id = np.array(category_ids, dtype=np.int64)
+        self.flags = np.array(flags, dtype=np.uint8)
+        self.updated_at = np.array(updated_at, dtype=np.int64)
+        self.image_offsets = np.array(image_offsets, dtype=np.int64)
+        self.image_id = np.array(image_ids, dtype=np.int64)
+        self.image_perspective = np.array(perspectives, dtype=np.int64)
+        self.image_urls = {
+            field: np.array(values, dtype=np.int32)
+            for field, values in image_urls.items()
+        }
+        self.nutrition_id = np.array(nutrition_ids, dtype=np.int64)
+        self.nutrients = {
+            field: np.array(values, dtype=np.float64)
+            for field, values in nutrients.items()
+        }
+        self.history_offsets = np.array(history_offsets, dtype=np.int64)
+        self.history_id = np.array(history_ids, dtype=np.int64)
+        self.history_price = np.array(history_prices, dtype=np.float64)
+        self.history_timestamp = np.array(history_timestamps, dtype=np.int64)
+        self._init_state()
+
+    def _init_state(self, generation: int = 0, written_at: Optional[float] = None):
+        # Unique per snapshot object, to key data derived from its products
+        self.serial = next(_serials)
+        # Snapshot file generation and write time, for mapped snapshots
+        self.generation = generation
+        self.written_at = written_at
+        # Products replaced or appended after the snapshot was built
+        self.overrides: Dict[int, Any] = {}
+        self.appended = 0
+        self.food_categories: Dict[int, bool] = {}
+        # Hash indexes by field, see `index`
+        self.indexes: Dict[str, Dict[str, int]] = {}
+        # Sort keys and positions by sort field, see `page`
+        self.orders: Dict[str, Tuple[List[Tuple[Any, str]], List[int]]] = {}
+        # Search index, see `app.shared.search.search_index`
+        self.search_index: Optional[Any] = None
+        self.index_lock = threading.Lock()
+
+    def write(self, path: str, generation: int):
+        """
+        Write the columns to a snapshot file, atomically replacing `path`.
+
+        The file starts with a fixed header (magic, format version, generation,
+        write time and the layout of the rest), followed by a JSON directory of
+        the arrays and the 64-byte aligned array and string data.
+        """
+        if self.overrides:
+            raise ValueError("Only catalog columns can be written to a snapshot")
+        arrays = self.arrays()
+        directory: Dict[str, Any] = {
+            "size": self.size,
+            "categories": list(self.categories.values()),
+            "arrays": {},
+        }
+        offset = 0
+        for name, array in arrays.items():
+            directory["arrays"][name] = [array.dtype.str, offset, len(array)]
+            offset = _aligned(offset + array.nbytes)
+        directory["strings"] = [offset, len(self.strings.data)]
+        encoded_directory = json.dumps(directory).encode()
+        data_offset = _aligned(SNAPSHOT_HEADER.size + len(encoded_directory))
+
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(
+                SNAPSHOT_HEADER.pack(
+                    SNAPSHOT_MAGIC,
+                    SNAPSHOT_VERSION,
+                    generation,
+                    time.time(),
+                    len(encoded_directory),
+                    data_offset,
+                )
+            )
+            file.write(encoded_directory)
+            for name, array in arrays.items():
+                file.seek(data_offset + directory["arrays"][name][1])
+                file.write(np.ascontiguousarray(array).tobytes())
+            file.seek(data_offset + directory["strings"][0])
+            file.write(self.strings.data)
+            file.flush()
+            os.fsync(file.fileno())
+        # Readers keep the previous file mapped until they switch
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def open(cls, path: str) -> "CatalogSnapshot":
+        """
+        Memory-map a snapshot file read-only. The columns are views of the
+        mapping, so processes mapping the same file share its pages.
+        """
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = read_header(buffer)
+        if header is None:
+            raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot")
+        generation, written_at, directory_length, data_offset = header
+        start = SNAPSHOT_HEADER.size
+        directory = json.loads(buffer[start : start + directory_length])
+
+        arrays = {
+            name: np.frombuffer(
+                buffer, dtype=dtype, count=length, offset=data_offset + offset
+            )
+            if length
+            else np.empty(0, dtype=dtype)
+            for name, (dtype, offset, length) in directory["arrays"].items()
+        }
+        strings_offset, strings_length = directory["strings"]
+        snapshot = cls.__new__(cls)
+        snapshot.strings = StringTable()
+        snapshot.strings.data = memoryview(buffer)[
+            data_offset + strings_offset : data_offset + strings_offset + strings_length
+        ]
+        snapshot.strings.offsets = arrays.pop("string_offsets")
+        snapshot.size = directory["size"]
+        snapshot.categories = {
+            category["id"]: category for category in directory["categories"]
+        }
+        snapshot.string_columns = {
+            field: arrays[f"string_{field}"] for field in STRING_FIELDS
+        }
+        snapshot.image_urls = {
+            field: arrays[f"image_{field}"] for field in IMAGE_URL_FIELDS
+        }
+        snapshot.nutrients = {
+            field: arrays[f"nutrient_{field}"] for field in NUTRIENT_FIELDS
+        }
+        for name in COLUMN_ARRAYS:
+            setattr(snapshot, name, arrays[name])
+        snapshot._init_state(generation, written_at)
+        return snapshot
+
+    def __len__(self) -> int:
+        return self.size + self.appended
+
+    def __getitem__(self, position: Union[int, slice]) -> Any:
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("catalog position out of range")
+        if position in self.overrides:
+            product = self.overrides[position]
+            if isinstance(product, ProductView):
+                return product.snapshot.product(product.position)
+            return product
+        return self.product(position)
+
+    def __setitem__(self, position: int, product: Any):
+        if not 0 <= position < len(self):
+            raise IndexError("catalog position out of range")
+        previous = self[position] if self.indexes else None
+        self._override(position, product)
+        for field, index in self.indexes.items():
+            value = getattr(previous, field)
+            if value != getattr(product, field) and index.get(value) == position:
+                # Other products may share the value, like EANs, index the next
+                other = next(
+                    (
+                        other
+                        for other, other_value in enumerate(self.column(field))
+                        if other_value == value and other != position
+                    ),
+                    None,
+                )
+                if other is None:
+                    del index[value]
+                else:
+                    index[value] = other
+            new_value = getattr(product, field)
+            index[new_value] = min(index.get(new_value, position), position)
+
+    def append(self, product: Any):
+        position = len(self)
+        self.appended += 1
+        self._override(position, product)
+        for field, index in self.indexes.items():
+            index.setdefault(getattr(product, field), position)
+
+    def _override(self, position: int, product: Any):
+        self.overrides[position] = product
+        self.orders = {}
+        self.search_index = None
+        if isinstance(product, ProductView):
+            for category_id, category in product.snapshot.categories.items():
+                if category_id not in self.categories:
+                    self.categories[category_id] = category
+                    self.food_categories.pop(category_id, None)
+
+    def copy(self) -> "CatalogSnapshot":
+        """
+        Snapshot sharing the columns of this one, to be patched apart: its
+        overrides, categories and derived indexes are its own.
+        """
+        snapshot = copy.copy(self)
+        snapshot._init_state(self.generation, self.written_at)
+        snapshot.categories = dict(self.categories)
+        snapshot.overrides = dict(self.overrides)
+        snapshot.appended = self.appended
+        return snapshot
+
+    def views(self) -> List[ProductView]:
+        """Views of every product, to patch another snapshot with."""
+        return [ProductView(self, position) for position in range(self.size)]
+
+    def column(self, field: str) -> List[Optional[str]]:
+        """Values of a string field for every product, in catalog order."""
+        values = [self.strings[i] for i in self.string_columns[field].tolist()]
+        for position, product in self.overrides.items():
+            if position < self.size:
+                values[position] = getattr(product, field)
+            else:
+                values.append(getattr(product, field))
+        return values
+
+    @property
+    def prices(self) -> List[float]:
+        prices = self.price.tolist()
+        for position, product in self.overrides.items():
+            if position < self.size:
+                prices[position] = product.price
+            else:
+                prices.append(product.price)
+        return prices
+
+    @property
+    def last_updated(self) -> Optional[datetime]:
+        """Latest `updated_at` of the products, None for an empty catalog."""
+        values = [product.updated_at for product in self.overrides.values()]
+        if self.size:
+            values.append(from_microseconds(self.updated_at.max()))
+        return max(values, default=None)
+
+    @property
+    def version(self) -> str:
+        """
+        Catalog generation id, from the product count and the latest update.
+        Every product a crawl adds or changes moves it, reloading the same
+        products keeps it.
+        """
+        last_updated = self.last_updated
+        updated = to_microseconds(last_updated) if last_updated else 0
+        return f"{len(self)}-{updated:x}"
+
+    def index(self, field: str) -> Dict[str, int]:
+        """
+        Hash index from the values of a string field to the position of the
+        first product having them, built on first use and kept up to date.
+        """
+        index = self.indexes.get(field)
+        if index is None:
+            with self.index_lock:
+                index = self.indexes.get(field)
+                if index is None:
+                    index = {}
+                    for position, value in enumerate(self.column(field)):
+                        index.setdefault(value, position)  # type: ignore[arg-type]
+                    self.indexes[field] = index
+        return index
+
+    def sort_values(self, field: str) -> List[Any]:
+        """
+        Values of a sort field for every product, in catalog order; updates as
+        microseconds since the epoch.
+        """
+        if field == "price":
+            return self.prices
+        if field != "updated_at":
+            return self.column(field)
+        values = self.updated_at.tolist()
+        for position, product in self.overrides.items():
+            value = to_microseconds(product.updated_at)
+            if position < self.size:
+                values[position] = value
+            else:
+                values.append(value)
+        return values
+
+    def page(
+        self, field: str, after: Optional[Tuple[Any, str]], limit: int
+    ) -> Tuple[List[int], Optional[Tuple[Any, str]]]:
+        """
+        Positions of the first `limit` products ordered by `field` then id,
+        starting after the sort key `after`, and the sort key to continue from,
+        None on the last page. The order is built on first use.
+        """
+        order = self.orders.get(field)
+        if order is None:
+            with self.index_lock:
+                order = self.orders.get(field)
+                if order is None:
+                    ids = cast(List[str], self.column("id"))
+                    keys = list(zip(self.sort_values(field), ids))
+                    positions = sorted(range(len(keys)), key=keys.__getitem__)
+                    order = [keys[position] for position in positions], positions
+                    self.orders[field] = order
+        keys, positions = order
+        start = 0 if after is None else bisect.bisect_right(keys, tuple(after))
+        end = start + max(limit, 0)
+        next_key = keys[end - 1] if end < len(keys) and end > start else None
+        return positions[start:end], next_key
+
+    def find(self, product_id: str) -> Optional[int]:
+        """Position of a product by id, None if not in the catalog."""
+        return self.index("id").get(product_id)
+
+    def find_ean(self, ean: str) -> Optional[int]:
+        """Position of a product by EAN barcode, None if not in the catalog."""
+        return self.index("ean").get(ean)
+
+    def product(self, position: int) -> ProductPublic:
+        """Materialize the public model of the product at a column position."""
+        return ProductPublic.model_validate(self.row(position))
+
+    def row(
+        self, position: int, fields: Optional[Collection[str]] = None
+    ) -> Dict[str, Any]:
+        """
+        `ProductPublic` fields of the product at a position, as a plain dict
+        ready to be serialized, only `fields` if given. Nested fields that are
+        not requested are never built.
+        """
+        if position in self.overrides:
+            product = self.overrides[position]
+            if isinstance(product, ProductView):
+                return product.snapshot.row(product.position, fields)
+            return ProductPublic.model_validate(product).model_dump(
+                include=None if fields is None else set(fields)
+            )
+        wanted = PRODUCT_FIELDS if fields is None else fields
+        row: Dict[str, Any] = {
+            field: self.strings[int(self.string_columns[field][position])]
+            for field in STRING_FIELDS
+        }
+        product_id = row["id"]
+        unit_size = float(self.unit_size[position])
+        flags = int(self.flags[position])
+        category_id = int(self.category_id[position])
+        row.update(
+            price=float(self.price[position]),
+            unit_size=None if np.isnan(unit_size) else unit_size,
+            category_id=category_id,
+            is_variable_weight=bool(flags & VARIABLE_WEIGHT),
+            is_pack=bool(flags & PACK),
+            updated_at=from_microseconds(self.updated_at[position]),
+            category=self.categories.get(category_id),
+        )
+
+        if "images" in wanted:
+            start, end = self.image_offsets[position : position + 2]
+            row["images"] = [
+                {
+                    **{
+                        field: self.strings[int(self.image_urls[field][i])]
+                        for field in IMAGE_URL_FIELDS
+                    },
+                    "perspective": int(self.image_perspective[i]),
+                    "id": int(self.image_id[i]),
+                    "product_id": product_id,
+                }
+                for i in range(start, end)
+            ]
+
+        if "nutritional_information" in wanted:
+            nutrition_id = int(self.nutrition_id[position])
+            row["nutritional_information"] = None
+            if nutrition_id >= 0:
+                row["nutritional_information"] = {
+                    **{
+                        field: None if np.isnan(value) else value
+                        for field in NUTRIENT_FIELDS
+                        for value in [float(self.nutrients[field][position])]
+                    },
+                    "id": nutrition_id,
+                    "product_id": product_id,
+                }
+
+        if "price_history" in wanted:
+            start, end = self.history_offsets[position : position + 2]
+            row["price_history"] = [
+                {
+                    "price": float(self.history_price[i]),
+                    "timestamp": from_microseconds(self.history_timestamp[i]),
+                    "id": int(self.history_id[i]),
+                    "product_id": product_id,
+                }
+                for i in range(start, end)
+            ]
+
+        if "is_food" in wanted:
+            row["is_food"] = self.is_food(category_id)
+        return {field: row[field] for field in PRODUCT_FIELDS if field in wanted}
+
+    def is_food(self, category_id: int) -> bool:
+        if category_id not in self.food_categories:
+            category = self.categories.get(category_id)
+            self.food_categories[category_id] = category is not None and (
+                is_food_category(Category.model_validate(category))
+            )
+        return self.food_categories[category_id]
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Every column of the snapshot by name."""
+        return {
+            "string_offsets": self.strings.offsets,
+            **{f"string_{f}": a for f, a in self.string_columns.items()},
+            **{f"image_{f}": a for f, a in self.image_urls.items()},
+            **{f"nutrient_{f}": a for f, a in self.nutrients.items()},
+            **{name: getattr(self, name) for name in COLUMN_ARRAYS},
+        }
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the columns and the string table."""
+        return len(self.strings.data) + sum(
+            array.nbytes for array in self.arrays().values()
+        )
+
+
+def memory_report(snapshot: Optional[CatalogSnapshot] = None) -> Dict[str, Any]:
+    """Memory used by the process and, if given, by a catalog snapshot."""
+    report: Dict[str, Any] = {
+        # Linux reports the peak resident set size in KiB
+        "max_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    if snapshot is not None:
+        report.update(
+            products=len(snapshot),
+            catalog_kib=snapshot.nbytes // 1024,
+            strings=len(snapshot.strings),
+            mapped=snapshot.written_at is not None,
+            generation=snapshot.generation,
+        )
+    return report
+
+
+def read_header(buffer: Any) -> Optional[Tuple[int, float, int, int]]:
+    """
+    Generation, write time, directory length and data offset of a snapshot
+    file buffer, None if it is not a snapshot of the current format version.
+    """
+    if len(buffer) < SNAPSHOT_HEADER.size:
+        return None
+    magic, version, *header = SNAPSHOT_HEADER.unpack_from(buffer)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        return None
+    return tuple(header)  # type: ignore[return-value]
+
+
+def snapshot_generation(path: str = CATALOG_SNAPSHOT_PATH) -> Optional[int]:
+    """Generation of the snapshot file, reading only its header."""
+    try:
+        with open(path, "rb") as file:
+            header = read_header(file.read(SNAPSHOT_HEADER.size))
+    except OSError:
+        return None
+    return header[0] if header else None
+
+
+def open_snapshot(
+    max_age: float, path: str = CATALOG_SNAPSHOT_PATH
+) -> Optional[CatalogSnapshot]:
+    """
+    Map the snapshot file if enabled, valid and written less than `max_age`
+    seconds ago; None if the catalog has to be loaded from the database.
+    """
+    if not path:
+        return None
+    try:
+        snapshot = CatalogSnapshot.open(path)
+    except (OSError, ValueError) as e:
+        logger.debug(f"No usable catalog snapshot at {path}: {str(e)}")
+        return None
+    if snapshot.written_at is None or time.time() - snapshot.written_at > max_age:
+        return None
+    return snapshot
+
+
+def write_snapshot(
+    snapshot: CatalogSnapshot, path: str = CATALOG_SNAPSHOT_PATH
+) -> Optional[CatalogSnapshot]:
+    """
+    Write a freshly loaded catalog to the snapshot file, if enabled, with the
+    next generation, and map it back. None if not written.
+    """
+    if not path:
+        return None
+    try:
+        snapshot.write(path, (snapshot_generation(path) or 0) + 1)
+        return CatalogSnapshot.open(path)
+    except (OSError, ValueError) as e:
+        logger.error(f"Error writing catalog snapshot to {path}: {str(e)}")
+        return None
@@ -0,0 +1,112 @@
+"""
+Streaming export of the whole product catalog.
+
+Products are written as NDJSON, one `ProductPublic` object per line ordered by
+id, from the cached catalog snapshot when it is loaded and else from the
+database, in keyset batches of consecutive ids. Either way memory stays constant
+whatever the catalog size. The stream is compressed on the fly with zstd or
+gzip.
+"""
+
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Iterable, Iterator, List, Optional
+
+import numpy as np
+import zstandard
+from pydantic_core import to_json
+from sqlmodel import Session
+
+from app.shared.cache import load_products_page
+from app.shared.catalog import CatalogSnapshot, to_microseconds
+
+# Products read from the database per batch
+EXPORT_BATCH_SIZE = 500
+# Bytes of NDJSON buffered before they are compressed and sent
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def export_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Content encoding of an export for an `Accept-Encoding` header, zstd first,
+    None for an uncompressed export.
+    """
+    accepted = set()
+    for coding in accept_encoding.split(","):
+        name, _, params = coding.partition(";")
+        quality = params.strip().removeprefix("q=")
+        if params and quality.replace(".", "", 1).isdigit() and float(quality) == 0:
+            continue
+        accepted.add(name.strip().lower())
+    return next((name for name in ("zstd", "gzip") if name in accepted), None)
+
+
+def utc_naive(value: datetime) -> datetime:
+    """A timestamp as naive UTC, the way `updated_at` is stored."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def snapshot_lines(
+    products: CatalogSnapshot, fields: List[str], since: Optional[datetime] = None
+) -> Iterator[bytes]:
+    """NDJSON lines of the snapshot products updated after `since`."""
+    positions, _ = products.page("id", None, len(products))
+    if since is not None:
+        updated = np.array(products.sort_values("updated_at"), dtype=np.int64)
+        changed = updated[positions] > to_microseconds(since)
+        positions = np.asarray(positions)[changed].tolist()
+    for position in positions:
+        yield to_json(products.row(position, fields)) + b"\n"
+
+
+def database_lines(
+    bind: Any, fields: List[str], since: Optional[datetime] = None
+) -> Iterator[bytes]:
+    """
+    NDJSON lines of the database products updated after `since`, read by
+    batches of consecutive ids in a session of its own on `bind`, as the
+    response outlives the request session.
+    """
+    after = None
+    with Session(bind=bind) as session:
+        while True:
+            batch = load_products_page(
+                session, "id", after, EXPORT_BATCH_SIZE, since=since
+            )
+            # Render through a snapshot for the same JSON as the cached catalog
+            products = CatalogSnapshot(batch)
+            for position in range(len(products)):
+                yield to_json(products.row(position, fields)) + b"\n"
+            if len(batch) < EXPORT_BATCH_SIZE:
+                return
+            after = (batch[-1].id, batch[-1].id)
+            session.expunge_all()
+
+
+def compressed(lines: Iterable[bytes], encoding: Optional[str]) -> Iterator[bytes]:
+    """`lines` in chunks of about `EXPORT_CHUNK_SIZE`, compressed if asked."""
+    compressor: Any
+    if encoding == "zstd":
+        compressor = zstandard.ZstdCompressor().compressobj()
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    else:
+        compressor = None
+    buffer: List[bytes] = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            chunk = b"".join(buffer)
+            buffer, size = [], 0
+            chunk = compressor.compress(chunk) if compressor else chunk
+            if chunk:
+                yield chunk
+    chunk = b"".join(buffer)
+    if compressor:
+        chunk = compressor.compress(chunk) + compressor.flush()
+    if chunk:
+        yield chunk
@@ -0,0 +1,149 @@
+"""
+Full-text product search with SQLite FTS5.
+
+`product_fts` indexes the name, brand, description and category name of every
+product, folded with `normalize_name` like the matcher folds names: lowercase,
+accents transliterated by `unidecode`, punctuation dropped. Each row carries
+the id of its product in an unindexed column, as product rowids are not
+stable: they are renumbered by `VACUUM` and table rebuilds. Queries are folded
+the same way, every word matching as a prefix for typeahead, and ranked by
+BM25.
+
+The crawler keeps the index in sync through `index_products`, and
+`rebuild_product_fts` creates and fills it from scratch. Databases created
+from the models rather than by the migrations get it on first use.
+"""
+
+import weakref
+from typing import Any, List, Optional
+
+from loguru import logger
+from sqlalchemy import bindparam, select, text
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from app.models import Category, Product
+from app.shared.product_matcher import normalize_name
+
+FTS_TABLE = "product_fts"
+FTS_COLUMNS = ["name", "brand", "description", "category"]
+# BM25 weight of a match in each column, in FTS_COLUMNS order
+FTS_WEIGHTS = [10.0, 4.0, 1.0, 2.0]
+
+CREATE_PRODUCT_FTS = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+USING fts5(id UNINDEXED, {", ".join(FTS_COLUMNS)}, prefix='2 3')
+"""
+
+# Engines whose database is known to have the full-text index
+_indexed_engines: "weakref.WeakSet[Engine]" = weakref.WeakSet()
+
+
+def fts_text(value: Optional[str]) -> str:
+    return normalize_name(value) if value else ""
+
+
+def match_query(query: str) -> str:
+    """FTS5 query matching every word of `query` as a prefix, empty if none."""
+    return " ".join(f'"{word}"*' for word in fts_text(query).split())
+
+
+def ensure_product_fts(session: Session) -> None:
+    """Create and fill the full-text index if the database has none yet."""
+    connection = session.connection()
+    if connection.engine in _indexed_engines:
+        return
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE},
+    ).first()
+    if exists is None:
+        count = rebuild_product_fts(session)
+        logger.warning(f"Created the missing full-text index of {count} products")
+    _indexed_engines.add(connection.engine)
+
+
+def _index(session: Session, where: Any = None) -> int:
+    query = (
+        select(  # type: ignore
+            Product.id,
+            Product.name,
+            Product.brand,
+            Product.description,
+            Category.name,
+        )
+        .select_from(Product)
+        .outerjoin(Category, Category.id == Product.category_id)  # type: ignore
+    )
+    if where is not None:
+        query = query.where(where)
+    connection = session.connection()
+    rows = [
+        {"id": row[0], **dict(zip(FTS_COLUMNS, map(fts_text, row[1:])))}
+        for row in connection.execute(query)
+    ]
+    if where is None:
+        connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    elif rows:
+        # `id` is unindexed, delete every replaced row in a single scan
+        connection.execute(
+            text(f"DELETE FROM {FTS_TABLE} WHERE id IN :ids").bindparams(
+                bindparam("ids", expanding=True)
+            ),
+            {"ids": [row["id"] for row in rows]},
+        )
+    if rows:
+        connection.execute(
+            text(
+                f"INSERT INTO {FTS_TABLE} (id, {', '.join(FTS_COLUMNS)})"
+                f" VALUES (:id, {', '.join(':' + c for c in FTS_COLUMNS)})"
+            ),
+            rows,
+        )
+    return len(rows)
+
+
+def index_products(session: Session, where: Any = None) -> int:
+    """
+    Index the products matching a condition on `Product`, all if None,
+    replacing their previous rows. The caller commits.
+    """
+    ensure_product_fts(session)
+    return _index(session, where)
+
+
+def rebuild_product_fts(session: Session) -> int:
+    """Create the full-text index if missing and index every product."""
+    connection = session.connection()
+    connection.execute(text(CREATE_PRODUCT_FTS))
+    count = _index(session)
+    connection.execute(
+        text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+    )
+    session.commit()
+    return count
+
+
+def search_product_ids(
+    session: Session, query: str, limit: Optional[int] = None
+) -> List[str]:
+    """Ids of the products matching a full-text query, most relevant first."""
+    match = match_query(query)
+    if not match:
+        return []
+    ensure_product_fts(session)
+    # The unindexed id column comes first and never matches
+    weights = ", ".join(map(str, [0.0, *FTS_WEIGHTS]))
+    # Rank on the index alone, only the kept rows read their product id
+    rows = session.connection().execute(
+        text(
+            f"SELECT {FTS_TABLE}.id FROM ("
+            f"SELECT rowid, bm25({FTS_TABLE}, {weights}) AS score FROM {FTS_TABLE}"
+            f" WHERE {FTS_TABLE} MATCH :match ORDER BY score LIMIT :limit"
+            f") AS matches JOIN {FTS_TABLE} ON {FTS_TABLE}.rowid = matches.rowid"
+            f" JOIN product ON product.id = {FTS_TABLE}.id"
+            " ORDER BY matches.score"
+        ),
+        {"match": match, "limit": -1 if limit is None else limit},
+    )
+    return [row[0] for row in rows]
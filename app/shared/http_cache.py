@@ -0,0 +1,115 @@
+"""
+HTTP caching of catalog reads.
+
+Catalog responses carry the catalog generation id as a strong `ETag`, the
+latest product update as `Last-Modified` and a public `Cache-Control`, so
+clients and CDNs can revalidate instead of downloading the catalog again.
+Conditional requests for an unchanged catalog get an empty 304 without
+rendering the response. Responses built from more than the catalog snapshot
+get validators of their own, such as a digest of their content.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Callable, Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from app.shared.catalog import CatalogSnapshot
+from app.shared.projection import JSONBytesResponse
+
+# Seconds clients and shared caches may reuse a catalog response
+CATALOG_MAX_AGE = int(os.getenv("CATALOG_MAX_AGE", "60"))
+
+
+def cache_headers(
+    version: str, last_updated: Optional[datetime] = None
+) -> Dict[str, str]:
+    """Validators and caching policy of a catalog response."""
+    headers = {
+        "ETag": f'"{version}"',
+        "Cache-Control": f"public, max-age={CATALOG_MAX_AGE}",
+    }
+    if last_updated is not None:
+        headers["Last-Modified"] = format_datetime(
+            last_updated.replace(tzinfo=timezone.utc), usegmt=True
+        )
+    return headers
+
+
+def catalog_headers(products: CatalogSnapshot) -> Dict[str, str]:
+    """Validators and caching policy of responses built from `products`."""
+    return cache_headers(products.version, products.last_updated)
+
+
+def content_version(content: bytes) -> str:
+    """Version of a response body for its `ETag`, a digest of its content."""
+    return hashlib.blake2b(content, digest_size=12).hexdigest()
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def _not_modified_since(
+    if_modified_since: str, last_updated: Optional[datetime]
+) -> bool:
+    if last_updated is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have a precision of one second
+    return last_updated.replace(tzinfo=timezone.utc, microsecond=0) <= since
+
+
+def conditional_response(
+    request: Request,
+    version: str,
+    render: Callable[[], bytes],
+    last_updated: Optional[datetime] = None,
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    JSON response rendered by `render`, or 304 Not Modified when the request
+    validators still match `version` and `last_updated`; `headers` are added
+    to both.
+    """
+    headers = {**cache_headers(version, last_updated), **(headers or {})}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, headers["ETag"])
+    elif "if-modified-since" in request.headers:
+        not_modified = _not_modified_since(
+            request.headers["if-modified-since"], last_updated
+        )
+    else:
+        not_modified = False
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    return JSONBytesResponse(content=render(), headers=headers)
+
+
+def catalog_response(
+    request: Request,
+    products: CatalogSnapshot,
+    render: Callable[[], bytes],
+    headers: Optional[Dict[str, str]] = None,
+) -> Response:
+    """
+    JSON response rendered from the catalog, or 304 Not Modified when the
+    request validators still match it; `headers` are added to both.
+    """
+    return conditional_response(
+        request, products.version, render, products.last_updated, headers
+    )
@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from loguru import logger
+from sqlalchemy import func
+from sqlmodel import Session, select
+
+from app.models import Product
+from app.shared.cache import load_products
+from app.shared.catalog import CatalogSnapshot
+from app.shared.product_matcher import ProductIndex, match_cache
+
+# Seconds between checks for products changed since the matching index was loaded
+INDEX_REFRESH_INTERVAL = float(os.getenv("INDEX_REFRESH_INTERVAL", "60"))
+
+
+class PeriodicRefresh:
+    """
+    In-memory state refreshed from the database on the matching path, at most
+    once per `refresh_interval` seconds. Subclasses implement `refresh`, and
+    set `refreshed_at` to `time.monotonic()` when done.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.refreshed_at: Optional[float] = None
+
+    def refresh(self, session: Session) -> int:
+        """Load the changes since the previous refresh, returns how many."""
+        raise NotImplementedError
+
+    def maybe_refresh(self, get_session: Callable[[], Session]) -> int:
+        """Refresh if the last refresh is older than the refresh interval."""
+        if (
+            self.refreshed_at is not None
+            and time.monotonic() - self.refreshed_at < self.refresh_interval
+        ):
+            return 0
+        return self.refresh(get_session())
+
+
+class IndexRefresher(PeriodicRefresh):
+    """
+    Keeps the matching index of a process in sync with the database.
+
+    Checked from the matching path of every process holding an index, like
+    `AliasTable`: at most once per refresh interval, the latest product update
+    is read, and only when it is newer than the index are the products updated
+    since loaded and patched into the index, see `ProductIndex.update`.
+    """
+
+    def __init__(
+        self,
+        index: ProductIndex,
+        updated_at: Optional[datetime] = None,
+        refresh_interval: float = INDEX_REFRESH_INTERVAL,
+    ):
+        super().__init__(refresh_interval)
+        self.index = index
+        self.updated_at = updated_at
+        self.lock = threading.Lock()
+
+    def refresh(self, session: Session) -> int:
+        """Patch the index with the products changed since, returns how many."""
+        with self.lock:
+            latest: Optional[datetime] = session.exec(
+                select(func.max(Product.updated_at))
+            ).one()
+            changed = []
+            if latest is not None and (
+                self.updated_at is None or latest > self.updated_at
+            ):
+                index = self.index
+                changed = [
+                    product
+                    for product in load_products(session, since=self.updated_at)
+                    if product.id not in index.positions
+                    or index.products[index.positions[product.id]].updated_at
+                    != product.updated_at
+                ]
+                if changed:
+                    logger.info(
+                        f"Match cache stats before update: {match_cache.stats()}"
+                    )
+                    # Kept as columns in the index catalog, not as ORM objects
+                    index.update(CatalogSnapshot(changed).views())
+                self.updated_at = latest
+            self.refreshed_at = time.monotonic()
+
+        if changed:
+            logger.info(
+                f"Updated {len(changed)} changed products,"
+                f" {len(self.index)} for matching"
+            )
+        return len(changed)
@@ -0,0 +1,183 @@
+"""
+Dispatch product matching either to the Celery workers or to an in-process pool.
+
+`MATCHER_BACKEND` selects where matching runs:
+
+- `celery` (default): offload to the `high` queue workers.
+- `thread`: match in a thread pool of the API process, against its own index.
+- `process`: match in a pool of spawned processes, each holding its own index.
+
+Every request can also pick the matching engine, see `match_engines`.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import List, Literal, Optional, Sequence, Tuple
+
+from celery.result import allow_join_result
+from loguru import logger
+from sqlmodel import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.celery_config import celery_app
+from app.database import get_session
+from app.models import ProductMatch
+from app.shared.aliases import AliasTable
+from app.shared.cache import get_all_products
+from app.shared.index_refresh import IndexRefresher
+from app.shared.product_matcher import (
+    MatchEngine,
+    ProductIndex,
+    find_closest_products_batch_cached,
+    find_closest_products_cached,
+    default_engine,
+)
+from app.shared.sharded_matcher import sharded_matcher
+from app.shared.tfidf_matcher import tfidf_matcher
+
+MATCHER_BACKEND = os.getenv("MATCHER_BACKEND", "celery")
+MATCHER_WORKERS = int(os.getenv("MATCHER_WORKERS", str(os.cpu_count() or 1)))
+
+_executor: Executor | None = None
+# Patches the in-process index with the changed products, once loaded
+_refresher: IndexRefresher | None = None
+_index_lock = threading.Lock()
+aliases = AliasTable()
+
+MatchEngineName = Literal["fuzzy", "tfidf"]
+# Matching engines by name, `fuzzy` is the default one
+match_engines: dict[str, MatchEngine] = {
+    "fuzzy": sharded_matcher or default_engine,
+    "tfidf": tfidf_matcher,
+}
+
+
+def current_index(session: Session) -> ProductIndex:
+    """
+    Index of the catalog for in-process matching, built once for all the
+    matcher threads from the cached catalog, then patched with the changed
+    products like the workers' index, see `IndexRefresher`.
+    """
+    global _refresher
+    if _refresher is None:
+        with _index_lock:
+            if _refresher is None:
+                # Patched apart from the catalog served by the API
+                products = get_all_products(session).copy()
+                _refresher = IndexRefresher(
+                    ProductIndex(products), products.last_updated
+                )
+                logger.info(f"Indexed {len(products)} products for in-process matching")
+    _refresher.maybe_refresh(lambda: session)
+    return _refresher.index
+
+
+def _match(
+    session: Session | None, engine: str = "fuzzy", **kwargs
+) -> List[ProductMatch]:
+    session = session or next(get_session())
+    index = current_index(session)
+    aliases.maybe_refresh(lambda: session)
+    return find_closest_products_cached(
+        index, aliases=aliases, engine=match_engines[engine], **kwargs
+    )
+
+
+def _match_batch(
+    session: Session | None, engine: str = "fuzzy", **kwargs
+) -> List[List[ProductMatch]]:
+    session = session or next(get_session())
+    index = current_index(session)
+    aliases.maybe_refresh(lambda: session)
+    return find_closest_products_batch_cached(
+        index, aliases=aliases, engine=match_engines[engine], **kwargs
+    )
+
+
+def get_executor() -> Executor:
+    global _executor
+    if _executor is None:
+        if MATCHER_BACKEND == "process":
+            # Forking the threaded API process could copy locks held by its
+            # other threads into the pool processes
+            _executor = ProcessPoolExecutor(
+                max_workers=MATCHER_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        else:
+            _executor = ThreadPoolExecutor(
+                max_workers=MATCHER_WORKERS, thread_name_prefix="matcher"
+            )
+    return _executor
+
+
+async def _run_embedded(func, session: Session, *args, **kwargs):
+    # Sessions can't cross process boundaries, pool processes open their own
+    session_arg = None if MATCHER_BACKEND == "process" else session
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), partial(func, session_arg, *args, **kwargs)
+    )
+
+
+async def find_closest_products(
+    session: Session,
+    item_name: Optional[str] = None,
+    item_price: Optional[float] = None,
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    engine: MatchEngineName = "fuzzy",
+    timeout: float = 10,
+) -> List[ProductMatch]:
+    """Closest products of a single item, matched on the configured backend."""
+    kwargs = dict(
+        item_name=item_name,
+        item_price=item_price,
+        threshold=threshold,
+        max_matches=max_matches,
+        engine=engine,
+    )
+    if MATCHER_BACKEND == "celery":
+        task = celery_app.send_task(
+            "app.worker.find_closest_products_with_preload", kwargs=kwargs
+        )
+        matches = await run_in_threadpool(task.get, timeout=timeout)
+        return [ProductMatch.model_validate(match) for match in matches]
+    return await asyncio.wait_for(
+        _run_embedded(_match, session, **kwargs), timeout=timeout
+    )
+
+
+async def find_closest_products_batch(
+    session: Session,
+    items: Sequence[Tuple[Optional[str], Optional[float]]],
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    engine: MatchEngineName = "fuzzy",
+    timeout: float = 20,
+) -> List[List[ProductMatch]]:
+    """Closest products of every ticket item, matched on the configured backend."""
+    kwargs = dict(
+        items=items, threshold=threshold, max_matches=max_matches, engine=engine
+    )
+    if MATCHER_BACKEND == "celery":
+        task = celery_app.send_task(
+            "app.worker.find_closest_products_batch_with_preload", kwargs=kwargs
+        )
+
+        def get_results():
+            with allow_join_result():
+                return task.get(timeout=timeout)
+
+        results = await run_in_threadpool(get_results)
+        return [
+            [ProductMatch.model_validate(match) for match in matches]
+            for matches in results
+        ]
+    return await asyncio.wait_for(
+        _run_embedded(_match_batch, session, **kwargs), timeout=timeout
+    )
@@ -0,0 +1,61 @@
+"""
+Keyset pagination of catalog listings.
+
+Pages are ordered by a sort key, then by primary key, and continue after the
+last item of the previous page: the opaque `cursor` of the next page carries
+that item's sort key. Reaching any page costs O(page) whatever its depth, on
+the cached catalog snapshot (bisecting its sort order) as on the database (a
+range over indexed columns), and cursors stay valid across catalog reloads.
+"""
+
+import base64
+from typing import Any, Dict, Literal, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, Request
+from pydantic_core import from_json, to_json
+
+# Largest page of the catalog listings
+MAX_PAGE_SIZE = 1000
+
+ProductSortField = Literal["id", "name", "price", "updated_at"]
+# Types of the sort values in product cursors, updates as epoch microseconds
+PRODUCT_SORT_TYPES: Dict[str, Any] = {
+    "id": str,
+    "name": str,
+    "price": (int, float),
+    "updated_at": int,
+}
+
+
+def encode_cursor(sort: str, key: Sequence[Any]) -> str:
+    data = to_json([sort, *key])
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, sort: str, types: Sequence[Any]) -> Tuple[Any, ...]:
+    """Sort key of a cursor issued for `sort`, checked against `types`."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, *key = from_json(data)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if (
+        cursor_sort != sort
+        or len(key) != len(types)
+        or not all(isinstance(value, expected) for value, expected in zip(key, types))
+    ):
+        raise HTTPException(
+            status_code=400, detail=f"Invalid cursor for the {sort} order"
+        )
+    return tuple(key)
+
+
+def next_page_headers(
+    request: Request, sort: str, key: Optional[Sequence[Any]]
+) -> Dict[str, str]:
+    """`X-Next-Cursor` and `Link` headers to the next page, none on the last."""
+    if key is None:
+        return {}
+    cursor = encode_cursor(sort, key)
+    url = request.url.include_query_params(cursor=cursor)
+    return {"X-Next-Cursor": cursor, "Link": f'<{url}>; rel="next"'}
@@ -1,19 +1,469 @@
+import heapq
+import itertools
+import os
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict, defaultdict
+import numpy as np
 import unidecode
-from fuzzywuzzy import fuzz
+from fuzzywuzzy import fuzz, utils
 from loguru import logger
+from rapidfuzz import fuzz as rapid_fuzz, process
 from app.models import ProductMatch, ProductPublic
-from typing import List, Optional
+from app.shared.catalog import CatalogSnapshot
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Collection,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
+
+if TYPE_CHECKING:
+    from app.shared.aliases import AliasTable
+
+# Weights of the name and price similarities in the combined score
+NAME_WEIGHT = 0.7
+PRICE_WEIGHT = 0.3
+
+# Maximum number of prefiltered candidates scored with the fuzzy matcher
+MAX_CANDIDATES = int(os.getenv("MATCHER_MAX_CANDIDATES", "300"))
+# Recall guards: scan the whole catalog when the prefilter finds fewer
+# candidates, or the rest of it when no candidate scores this much
+MIN_CANDIDATES = int(os.getenv("MATCHER_MIN_CANDIDATES", "20"))
+MIN_CANDIDATE_SCORE = float(os.getenv("MATCHER_MIN_CANDIDATE_SCORE", "90"))
+# Updates a `ProductIndex` remembers, for engines holding an older generation
+# to patch their copy rather than reload it, see `changed_since`
+MAX_INDEX_HISTORY = int(os.getenv("MATCHER_INDEX_HISTORY", "100"))
+# Threads of the vectorized batch scoring, -1 for one per core
+BATCH_WORKERS = int(os.getenv("MATCHER_BATCH_WORKERS", "-1"))
+# Maximum number of match results kept by the match cache
+MATCH_CACHE_SIZE = int(os.getenv("MATCH_CACHE_SIZE", "10000"))
+
+_generations = itertools.count(1)
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize a product or ticket line name the same way for both sides of a match.
+
+    Equivalent to the preprocessing `fuzz.token_set_ratio` applies on top of
+    `unidecode(name.lower())`, so scores computed on normalized names with
+    `full_process=False` are identical to the original ones.
+    """
+    return utils.full_process(unidecode.unidecode(name.lower()), force_ascii=True)
+
+
+def name_grams(name: str) -> Iterable[str]:
+    """
+    Inverted index keys of a normalized name: its character trigrams and tokens.
+
+    Trigrams are taken per token with space padding, and tokens are stored with
+    the padding too, so a whole token never collides with a trigram key.
+    """
+    for token in set(name.split()):
+        padded = f" {token} "
+        yield padded
+        for i in range(len(padded) - 2):
+            yield padded[i : i + 3]
+
+
+class ProductIndex:
+    """
+    Catalog view precomputed once per catalog load for product matching.
+
+    Built from a `CatalogSnapshot` or a list of products. Holds the ids,
+    normalized names, token sets and prices of the products, so a query
+    only has to normalize its own input, an inverted index from name grams to
+    product positions used to prefilter fuzzy matching candidates, and the
+    positions sorted by price to bound the candidates by price.
+
+    Every index gets a new `generation`, identifying the catalog it was built from,
+    and a new one whenever it is patched by `update`. The positions patched by
+    the last `MAX_INDEX_HISTORY` updates are kept, so engines holding a copy of
+    a recent generation can patch it too, see `changed_since`.
+    """
+
+    def __init__(self, products: Union[CatalogSnapshot, Sequence[Any]]):
+        # The history holds every change since `history_generation`
+        self.generation = self.history_generation = next(_generations)
+        # (generation, positions patched to reach it) of the last updates
+        self.history: List[Tuple[int, List[int]]] = []
+        self.products: Any
+        self.ids: List[str]
+        self.prices: List[float]
+        if isinstance(products, CatalogSnapshot):
+            # Read the columns, without materializing any product
+            self.products = products
+            # Every product has an id and a name
+            self.ids = cast(List[str], products.column("id"))
+            names = cast(List[str], products.column("name"))
+            self.prices = products.prices
+        else:
+            self.products = list(products)
+            self.ids = [product.id for product in self.products]
+            names = [product.name for product in self.products]
+            self.prices = [product.price for product in self.products]
+        self.positions = {
+            product_id: position for position, product_id in enumerate(self.ids)
+        }
+        self.names = [normalize_name(name) for name in names]
+        self.tokens = [frozenset(name.split()) for name in self.names]
+        self.price_array = np.array(self.prices, dtype=np.float64)
+        self.price_order = array(
+            "l", sorted(range(len(self.prices)), key=self.prices.__getitem__)
+        )
+        self.sorted_prices = array("d", (self.prices[i] for i in self.price_order))
+        self.postings: dict[str, list[int]] = defaultdict(list)
+        for position, name in enumerate(self.names):
+            for gram in set(name_grams(name)):
+                self.postings[gram].append(position)
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def update(self, products: Sequence[Any]):
+        """
+        Patch the index in place with changed or new products.
+
+        Only the entries of the given products are touched, so the cost is
+        proportional to the number of changes. The index gets a new generation
+        once every product is patched, which invalidates cached matches.
+        """
+        appended = []
+        patched = []
+        for product in products:
+            position = self.positions.get(product.id)
+            if position is None:
+                position = len(self.products)
+                self.positions[product.id] = position
+                self.ids.append(product.id)
+                self.products.append(product)
+                self.names.append("")
+                self.tokens.append(frozenset())
+                self.prices.append(product.price)
+                appended.append(product.price)
+            else:
+                self.products[position] = product
+                self._remove_price(position)
+                self.prices[position] = product.price
+                if position < len(self.price_array):
+                    self.price_array[position] = product.price
+
+            name = normalize_name(product.name)
+            if name != self.names[position]:
+                old_grams = set(name_grams(self.names[position]))
+                new_grams = set(name_grams(name))
+                for gram in old_grams - new_grams:
+                    postings = self.postings[gram]
+                    del postings[bisect_left(postings, position)]
+                for gram in new_grams - old_grams:
+                    insort(self.postings[gram], position)
+                self.names[position] = name
+                self.tokens[position] = frozenset(name.split())
+
+            slot = bisect_right(self.sorted_prices, product.price)
+            self.sorted_prices.insert(slot, product.price)
+            self.price_order.insert(slot, position)
+            patched.append(position)
+
+        if appended:
+            self.price_array = np.concatenate([self.price_array, appended])
+        self.generation = next(_generations)
+        self.history.append((self.generation, patched))
+        if len(self.history) > MAX_INDEX_HISTORY:
+            self.history_generation, _ = self.history.pop(0)
+
+    def changed_since(self, generation: Optional[int]) -> Optional[List[int]]:
+        """
+        Positions patched since `generation` of this index, in order, or None
+        when `generation` is not one of its recent generations.
+        """
+        if generation == self.generation:
+            return []
+        changed: set[int] = set()
+        for update_generation, positions in reversed(self.history):
+            if update_generation == generation:
+                return sorted(changed)
+            changed.update(positions)
+        return sorted(changed) if generation == self.history_generation else None
+
+    def _remove_price(self, position: int):
+        slot = bisect_left(self.sorted_prices, self.prices[position])
+        while self.price_order[slot] != position:
+            slot += 1
+        del self.sorted_prices[slot]
+        del self.price_order[slot]
+
+    def candidates(
+        self,
+        query_name: str,
+        max_candidates: int = MAX_CANDIDATES,
+        min_candidates: int = MIN_CANDIDATES,
+    ) -> Optional[List[int]]:
+        """
+        Positions of the products sharing the most name grams with the query.
+
+        Returns None when the prefilter should not be trusted and the whole
+        catalog has to be scanned instead: fewer than `min_candidates` products
+        share any gram with the query.
+        """
+        counts: Counter[int] = Counter()
+        for gram in set(name_grams(query_name)):
+            counts.update(self.postings.get(gram, ()))
+        if len(counts) < min_candidates:
+            return None
+        return sorted(position for position, _ in counts.most_common(max_candidates))
+
+    def price_window(
+        self, item_price: float, threshold: float, with_name: bool
+    ) -> Optional[List[int]]:
+        """
+        Positions of the products whose price can still reach `threshold`.
+
+        The price score drops linearly to 0 at a 100% price difference, so given
+        the best name score a product could get, only prices within a window
+        around `item_price` can reach the threshold. That window is looked up by
+        binary search in the price sorted positions. Returns None when any price
+        could reach the threshold.
+        """
+        best_name_score = 100 * NAME_WEIGHT if with_name else 0.0
+        min_price_score = (threshold - best_name_score) / PRICE_WEIGHT
+        if min_price_score <= 0:
+            return None
+        if min_price_score > 100:
+            return []
+        # Small slack so float rounding never drops a product on the boundary
+        max_diff = item_price * (100 - min_price_score) / 100 + 1e-9
+        start = bisect_left(self.sorted_prices, item_price - max_diff)
+        end = bisect_right(self.sorted_prices, item_price + max_diff)
+        return sorted(self.price_order[start:end])
+
+
+def _score_positions(
+    index: ProductIndex,
+    positions: Iterable[int],
+    query_name: Optional[str],
+    item_price: Optional[float],
+    threshold: float,
+    max_matches: int,
+    top: List[Tuple[float, int]],
+    exclude: Collection[int] = (),
+) -> int:
+    """
+    Score products into `top`, a bounded min-heap of (score, -position) where
+    ties keep the earliest products. Returns the number of matches found.
+    """
+    match_count = 0
+    for position in positions:
+        if position in exclude:
+            continue
+        product_name = index.names[position]
+        name_score: float = 0.0
+        price_score: float = 0.0
+
+        if query_name and product_name:
+            name_score = fuzz.token_set_ratio(
+                query_name, product_name, full_process=False
+            )
+
+        if item_price:
+            price_diff = abs(index.prices[position] - item_price)
+            price_score = max(0, 100 - (price_diff / item_price) * 100)
+
+        combined_score = (name_score * NAME_WEIGHT) + (price_score * PRICE_WEIGHT)
+
+        if combined_score >= threshold:
+            match_count += 1
+            entry = (combined_score, -position)
+            if len(top) < max_matches:
+                heapq.heappush(top, entry)
+            elif top and entry > top[0]:
+                heapq.heapreplace(top, entry)
+    return match_count
+
+
+def score_closest_products(
+    index: ProductIndex,
+    item_name: Optional[str] = None,
+    item_price: Optional[float] = None,
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    max_candidates: int = MAX_CANDIDATES,
+    min_candidates: int = MIN_CANDIDATES,
+    exclude: Collection[int] = (),
+    min_candidate_score: float = MIN_CANDIDATE_SCORE,
+) -> List[Tuple[float, int]]:
+    """
+    Best (score, position) pairs of the index for an item, best first.
+
+    Name queries first score the candidates returned by the index prefilter, see
+    `ProductIndex.candidates`. When the best candidate scores below
+    `min_candidate_score`, products sharing fewer grams may still beat it, so
+    every other product that can still reach the last kept score is scored too.
+    Queries with a price only score products within `ProductIndex.price_window`.
+    Products at the `exclude` positions are skipped.
+    """
+    query_name = normalize_name(item_name) if item_name is not None else None
+    has_price = bool(item_price and item_price > 0)
+
+    def within_price_window(
+        positions: Optional[Iterable[int]], threshold: float
+    ) -> Optional[Iterable[int]]:
+        window = (
+            index.price_window(cast(float, item_price), threshold, bool(query_name))
+            if has_price
+            else None
+        )
+        if window is None:
+            return positions
+        return (
+            window if positions is None else sorted(set(positions).intersection(window))
+        )
+
+    candidates = (
+        index.candidates(query_name, max_candidates, min_candidates)
+        if query_name
+        else None
+    )
+    positions = within_price_window(candidates, threshold)
+    top: List[Tuple[float, int]] = []
+    match_count = _score_positions(
+        index,
+        range(len(index)) if positions is None else positions,
+        query_name,
+        item_price,
+        threshold,
+        max_matches,
+        top,
+        exclude,
+    )
+
+    if candidates is not None and (not top or max(top)[0] < min_candidate_score):
+        # Recall guard: the prefilter kept no good match, scan the rest of the
+        # catalog for products that can still enter the results
+        floor = top[0][0] if len(top) == max_matches else threshold
+        scored = set(candidates)
+        rest = within_price_window(None, floor)
+        match_count += _score_positions(
+            index,
+            (
+                position
+                for position in (range(len(index)) if rest is None else rest)
+                if position not in scored
+            ),
+            query_name,
+            item_price,
+            threshold,
+            max_matches,
+            top,
+            exclude,
+        )
+
+    logger.debug(
+        f"Found {match_count} matches for item '{item_name}' with price {item_price}"
+    )
+    return [
+        (score, -negative_position)
+        for score, negative_position in sorted(top, reverse=True)
+    ]
+
+
+def price_score_matrix(
+    index: ProductIndex, prices: Sequence[Optional[float]]
+) -> np.ndarray:
+    """Price scores of every product of the index for every price, 0 without price."""
+    query_prices = np.array([price or np.nan for price in prices])[:, np.newaxis]
+    with np.errstate(invalid="ignore"):
+        price_scores = (
+            100 - np.abs(index.price_array - query_prices) / query_prices * 100
+        )
+    return np.nan_to_num(np.maximum(price_scores, 0), nan=0.0)
+
+
+def score_closest_products_batch(
+    index: ProductIndex,
+    items: Sequence[Tuple[Optional[str], Optional[float]]],
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    exclude: Optional[Sequence[Collection[int]]] = None,
+    workers: int = BATCH_WORKERS,
+) -> List[List[Tuple[float, int]]]:
+    """
+    Best (score, position) pairs of the index for every item, best first.
+
+    Scores the full items x catalog matrix in one vectorized pass (rapidfuzz
+    `cdist` for names on `workers` threads, NumPy for prices) with the same
+    scoring as `score_closest_products`. `exclude` optionally holds the
+    excluded positions of each item.
+    """
+    if not len(index) or not items:
+        return [[] for _ in items]
+
+    query_names = [normalize_name(name) if name else "" for name, _ in items]
+    name_scores = np.rint(
+        # The stubs want a np.dtype, the implementation only takes scalar types
+        process.cdist(  # type: ignore[call-overload]
+            query_names,
+            index.names,
+            scorer=rapid_fuzz.token_set_ratio,
+            dtype=np.float64,
+            workers=workers,
+        )
+    )
+
+    combined_scores = (
+        name_scores * NAME_WEIGHT
+        + price_score_matrix(index, [price for _, price in items]) * PRICE_WEIGHT
+    )
+    for row, positions in enumerate(exclude or ()):
+        combined_scores[row, list(positions)] = -np.inf
+    ranking = np.argsort(-combined_scores, axis=1, kind="stable")[:, :max_matches]
+
+    return [
+        [
+            (float(row[position]), int(position))
+            for position in positions
+            if row[position] >= threshold
+        ]
+        for row, positions in zip(combined_scores, ranking)
+    ]
+
+
+def hydrate_matches(
+    index: ProductIndex, scored: Iterable[Tuple[float, int]]
+) -> List[ProductMatch]:
+    """Public models of scored positions, only built for the final matches."""
+    return [
+        ProductMatch(
+            score=score,
+            product=ProductPublic.model_validate(index.products[position]),
+        )
+        for score, position in scored
+    ]
 
 
 def find_closest_products_task(
-    products: List[ProductPublic] = [],
+    products: Union[ProductIndex, List[ProductPublic]] = [],
     item_name: Optional[str] = None,
     item_price: Optional[float] = None,
     threshold: float = 60.0,
     max_matches: int = 10,
+    max_candidates: int = MAX_CANDIDATES,
+    min_candidates: int = MIN_CANDIDATES,
+    exclude: Collection[int] = (),
 ) -> List[ProductMatch]:
     """
     Task to find closest products based on name and price similarity.
+
+    `products` should be a prebuilt `ProductIndex`; a plain product list is
+    indexed on the fly. See `score_closest_products` for the scoring.
     """
     logger.info(
         f"Processing product matching task for '{item_name}' with price {item_price}"
@@ -21,33 +471,257 @@ def find_closest_products_task(
     if not products:
         logger.warning("No products provided for matching.")
         return []
-    matches = []
+    index = products if isinstance(products, ProductIndex) else ProductIndex(products)
+    scored = score_closest_products(
+        index,
+        item_name,
+        item_price,
+        threshold,
+        max_matches,
+        max_candidates,
+        min_candidates,
+        exclude,
+    )
+    return hydrate_matches(index, scored)
 
-    for product in products:
-        name_score: float = 0.0
-        price_score: float = 0.0
 
-        if item_name is not None:
-            name_score = fuzz.token_set_ratio(
-                unidecode.unidecode(item_name.lower()),
-                unidecode.unidecode(product.name.lower()),
-            )
+def find_closest_products_batch(
+    products: Union[ProductIndex, List[ProductPublic]],
+    items: Sequence[Tuple[Optional[str], Optional[float]]],
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    exclude: Optional[Sequence[Collection[int]]] = None,
+) -> List[List[ProductMatch]]:
+    """
+    Find the closest products for every (name, price) item of a ticket at once.
 
-        if item_price:
-            price_diff = abs(product.price - item_price)
-            price_score = max(0, 100 - (price_diff / item_price) * 100)
+    See `score_closest_products_batch` for the scoring.
+    """
+    logger.info(f"Processing batch product matching task for {len(items)} items")
+    if not products or not items:
+        return [[] for _ in items]
+    index = products if isinstance(products, ProductIndex) else ProductIndex(products)
+    results = [
+        hydrate_matches(index, scored)
+        for scored in score_closest_products_batch(
+            index, items, threshold, max_matches, exclude
+        )
+    ]
+    logger.debug(
+        f"Found matches for {sum(1 for matches in results if matches)}/{len(items)} items"
+    )
+    return results
 
-        combined_score = (name_score * 0.7) + (price_score * 0.3)
 
-        if combined_score >= threshold:
-            matches.append(
-                ProductMatch(
-                    score=combined_score, product=ProductPublic.model_validate(product)
-                )
-            )
+class MatchEngine:
+    """
+    Scores queries against a `ProductIndex`; the default engine does it in the
+    calling process with `find_closest_products_task`.
+    """
 
-    matches.sort(key=lambda x: x.score, reverse=True)
-    logger.debug(
-        f"Found {len(matches)} matches for item '{item_name}' with price {item_price}"
+    name = "fuzzy"
+
+    def match(
+        self,
+        index: ProductIndex,
+        item_name: Optional[str],
+        item_price: Optional[float],
+        threshold: float,
+        max_matches: int,
+        exclude: Collection[int] = (),
+    ) -> List[ProductMatch]:
+        return find_closest_products_task(
+            index, item_name, item_price, threshold, max_matches, exclude=exclude
+        )
+
+    def match_batch(
+        self,
+        index: ProductIndex,
+        items: Sequence[Tuple[Optional[str], Optional[float]]],
+        threshold: float,
+        max_matches: int,
+        exclude: Optional[Sequence[Collection[int]]] = None,
+    ) -> List[List[ProductMatch]]:
+        return find_closest_products_batch(
+            index, items, threshold, max_matches, exclude=exclude
+        )
+
+
+default_engine = MatchEngine()
+
+
+class MatchCache:
+    """
+    Bounded LRU cache of match results of the current catalog generation.
+
+    Keys include the index generation, and the whole cache is dropped as soon as
+    a key of a newer generation is seen, so a catalog reload invalidates it.
+    """
+
+    def __init__(self, maxsize: int = MATCH_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.data: OrderedDict[tuple, Any] = OrderedDict()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(
+        index: ProductIndex,
+        item_name: Optional[str],
+        item_price: Optional[float],
+        threshold: float,
+        max_matches: int,
+        engine: MatchEngine,
+    ) -> tuple:
+        return (
+            index.generation,
+            normalize_name(item_name) if item_name is not None else None,
+            round(item_price, 2) if item_price is not None else None,
+            threshold,
+            max_matches,
+            engine.name,
+        )
+
+    def get(self, key: tuple) -> Any:
+        with self.lock:
+            if key in self.data:
+                self.hits += 1
+                self.data.move_to_end(key)
+                return self.data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key: tuple, value: Any):
+        with self.lock:
+            if key[0] != self.generation:
+                if key[0] < self.generation:
+                    return
+                self.data.clear()
+                self.generation = key[0]
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+match_cache = MatchCache()
+
+
+def _with_alias(
+    index: ProductIndex,
+    alias_position: Optional[int],
+    matches: List[ProductMatch],
+    max_matches: int,
+) -> List[ProductMatch]:
+    """Put the aliased product, if any, in front of the fuzzy matches."""
+    if alias_position is None:
+        return matches
+    alias_match = ProductMatch(
+        score=100.0,
+        product=ProductPublic.model_validate(index.products[alias_position]),
     )
-    return matches[:max_matches]
+    return [alias_match, *matches][:max_matches]
+
+
+def find_closest_products_cached(
+    index: ProductIndex,
+    item_name: Optional[str] = None,
+    item_price: Optional[float] = None,
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    aliases: Optional["AliasTable"] = None,
+    engine: MatchEngine = default_engine,
+) -> List[ProductMatch]:
+    """
+    `find_closest_products_task` going through the alias table and match cache.
+
+    A learned alias of the item name is returned as the best match, without any
+    fuzzy matching when only one match is wanted. Products reported as wrong
+    matches of the item name are never returned.
+    """
+    alias_position, excluded = (
+        aliases.resolve(index, item_name) if aliases else (None, set())
+    )
+    if alias_position is not None and max_matches == 1:
+        return _with_alias(index, alias_position, [], max_matches)
+
+    key = match_cache.key(index, item_name, item_price, threshold, max_matches, engine)
+    matches = match_cache.get(key)
+    if matches is None:
+        if alias_position is not None:
+            excluded.add(alias_position)
+        matches = _with_alias(
+            index,
+            alias_position,
+            engine.match(
+                index, item_name, item_price, threshold, max_matches, exclude=excluded
+            ),
+            max_matches,
+        )
+        match_cache.set(key, matches)
+    return matches
+
+
+def find_closest_products_batch_cached(
+    index: ProductIndex,
+    items: Sequence[Tuple[Optional[str], Optional[float]]],
+    threshold: float = 60.0,
+    max_matches: int = 10,
+    aliases: Optional["AliasTable"] = None,
+    engine: MatchEngine = default_engine,
+) -> List[List[ProductMatch]]:
+    """
+    `find_closest_products_batch` going through the alias table and match cache.
+
+    Only the items that are neither aliased nor cached are matched, see
+    `find_closest_products_cached`.
+    """
+    resolved = [
+        aliases.resolve(index, name) if aliases else (None, set()) for name, _ in items
+    ]
+    keys = [
+        match_cache.key(index, name, price, threshold, max_matches, engine)
+        for name, price in items
+    ]
+    results: List[Optional[List[ProductMatch]]] = []
+    for (alias_position, _), key in zip(resolved, keys):
+        if alias_position is not None and max_matches == 1:
+            results.append(_with_alias(index, alias_position, [], max_matches))
+        else:
+            results.append(match_cache.get(key))
+
+    missing = [i for i, matches in enumerate(results) if matches is None]
+    if missing:
+        excluded = []
+        for i in missing:
+            alias_position, item_excluded = resolved[i]
+            if alias_position is not None:
+                item_excluded.add(alias_position)
+            excluded.append(item_excluded)
+        matched = engine.match_batch(
+            index,
+            [items[i] for i in missing],
+            threshold,
+            max_matches,
+            exclude=excluded,
+        )
+        for i, matches in zip(missing, matched):
+            results[i] = _with_alias(index, resolved[i][0], matches, max_matches)
+            match_cache.set(keys[i], results[i])
+    return results  # type: ignore[return-value]
@@ -0,0 +1,89 @@
+"""
+Sparse fieldsets of the products returned by the API.
+
+Product endpoints take either `fields=` or `exclude=`, comma separated
+`ProductPublic` field names. Without any of them, the slim default leaves out
+the price history, which grows with every price change. Responses are built
+with only the selected fields and serialized directly, skipping the response
+model validation.
+
+Catalog products are serialized once per snapshot and field selection, and
+kept as JSON bytes in `json_cache`: list and batch responses only concatenate
+them.
+"""
+
+from typing import Any, Iterable, List, Optional
+
+from fastapi import HTTPException, Query
+from fastapi.responses import Response
+from pydantic_core import to_json
+
+from app.shared.cache import json_cache
+from app.shared.catalog import PRODUCT_FIELDS, CatalogSnapshot
+
+# Fields left out when neither `fields` nor `exclude` are given
+SLIM_EXCLUDE = {"price_history"}
+
+
+def _split(value: str) -> List[str]:
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = set(names) - set(PRODUCT_FIELDS)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown product fields: {', '.join(sorted(unknown))}",
+        )
+    return names
+
+
+def product_fields(
+    fields: Optional[str] = Query(
+        default=None, description="Comma separated product fields to return"
+    ),
+    exclude: Optional[str] = Query(
+        default=None,
+        description="Comma separated product fields to leave out, empty for all",
+    ),
+) -> List[str]:
+    """Selected product fields, in `ProductPublic` order."""
+    if fields is not None and exclude is not None:
+        raise HTTPException(
+            status_code=400, detail="Use either fields or exclude, not both"
+        )
+    if fields is not None:
+        selected = set(_split(fields))
+    else:
+        excluded = SLIM_EXCLUDE if exclude is None else set(_split(exclude))
+        selected = set(PRODUCT_FIELDS) - excluded
+    return [field for field in PRODUCT_FIELDS if field in selected]
+
+
+def excluded_fields(fields: List[str]) -> set[str]:
+    """Product fields left out by a selection, for nested `model_dump` excludes."""
+    return set(PRODUCT_FIELDS) - set(fields)
+
+
+class JSONBytesResponse(Response):
+    """JSON response whose content is already serialized."""
+
+    media_type = "application/json"
+
+
+def json_response(content: Any) -> Response:
+    return JSONBytesResponse(content=to_json(content))
+
+
+def product_json(products: CatalogSnapshot, position: int, fields: List[str]) -> bytes:
+    """JSON of the selected fields of a catalog product, serialized once."""
+    if position in products.overrides:
+        return to_json(products.row(position, fields))
+    key = (products.serial, tuple(fields), position)
+    value = json_cache.get(key)
+    if value is None:
+        value = to_json(products.row(position, fields))
+        json_cache.set(key, value)
+    return value
+
+
+def json_array(items: Iterable[bytes]) -> bytes:
+    return b"[" + b",".join(items) + b"]"
@@ -0,0 +1,231 @@
+"""
+Product search over the cached catalog.
+
+A `SearchIndex` is built once per catalog snapshot. Each numeric search key
+(price, price per unit, protein per euro and the nutrients) gets the product
+positions sorted by its value. Each category, and the food products, get a
+bitset of their products. A search bisects the sorted keys for its ranges,
+combines the bitsets of its other filters and walks the order of its sort key
+until the page is full, instead of scanning every product.
+"""
+
+import re
+from typing import Dict, Iterable, List, Literal, Optional, Sequence, Tuple, get_args
+
+import numpy as np
+from fastapi import HTTPException
+
+from app.shared.catalog import NUTRIENT_FIELDS, CatalogSnapshot
+
+# Sort keys of a search: the derived price keys, then every nutrient field
+SearchSortKey = Literal[
+    "price",
+    "unit_price",
+    "protein_per_euro",
+    "calories",
+    "total_fat",
+    "saturated_fat",
+    "polyunsaturated_fat",
+    "monounsaturated_fat",
+    "trans_fat",
+    "total_carbohydrate",
+    "dietary_fiber",
+    "total_sugars",
+    "protein",
+    "salt",
+]
+SEARCH_SORT_KEYS: List[str] = list(get_args(SearchSortKey))
+
+_CONDITION = re.compile(r"^\s*(\w+)\s*(<=|>=)\s*([-+0-9.eE]+)\s*$")
+
+# Inclusive (min, max) bounds of a search key, None when open
+Range = Tuple[Optional[float], Optional[float]]
+
+
+def nutrient_ranges(conditions: Iterable[str]) -> Dict[str, Range]:
+    """Ranges of nutrient conditions such as `protein>=10` or `salt<=0.5`."""
+    ranges: Dict[str, Range] = {}
+    for condition in conditions:
+        match = _CONDITION.match(condition)
+        if match is None or match[1] not in NUTRIENT_FIELDS:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid nutrient condition: {condition}"
+            )
+        try:
+            value = float(match[3])
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail=f"Invalid nutrient condition: {condition}"
+            )
+        low, high = ranges.get(match[1], (None, None))
+        if match[2] == ">=":
+            low = value if low is None else max(low, value)
+        else:
+            high = value if high is None else min(high, value)
+        ranges[match[1]] = (low, high)
+    return ranges
+
+
+def _key_columns(products: CatalogSnapshot) -> Dict[str, np.ndarray]:
+    """Values of every search key by position, NaN where unknown."""
+    size = len(products)
+    price = np.full(size, np.nan)
+    unit_size = np.full(size, np.nan)
+    nutrients = {field: np.full(size, np.nan) for field in NUTRIENT_FIELDS}
+    price[: products.size] = products.price
+    unit_size[: products.size] = products.unit_size
+    for field in NUTRIENT_FIELDS:
+        nutrients[field][: products.size] = products.nutrients[field]
+    for position, product in products.overrides.items():
+        price[position] = product.price
+        if product.unit_size is not None:
+            unit_size[position] = product.unit_size
+        nutrition = product.nutritional_information
+        for field in NUTRIENT_FIELDS:
+            value = None if nutrition is None else getattr(nutrition, field)
+            nutrients[field][position] = np.nan if value is None else value
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unit_price = price / unit_size
+        # Nutrients are per 100 g or ml, unit sizes in kg or l
+        protein_per_euro = nutrients["protein"] * unit_size * 10 / price
+    columns = {
+        "price": price,
+        "unit_price": unit_price,
+        "protein_per_euro": protein_per_euro,
+        **nutrients,
+    }
+    for values in columns.values():
+        values[~np.isfinite(values)] = np.nan
+    return columns
+
+
+class SearchIndex:
+    """Sorted search keys and category bitsets of a catalog snapshot."""
+
+    def __init__(self, products: CatalogSnapshot):
+        self.size = len(products)
+        # Per key: sorted values, positions in that order, count of known values
+        self.sorted: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        for key, values in _key_columns(products).items():
+            # NaN sorts last
+            order = np.argsort(values, kind="stable").astype(np.int32)
+            known = int(np.count_nonzero(~np.isnan(values)))
+            self.sorted[key] = (values[order[:known]], order, known)
+
+        category_ids = np.zeros(self.size, dtype=np.int64)
+        category_ids[: products.size] = products.category_id
+        for position, product in products.overrides.items():
+            category_ids[position] = product.category_id
+        # Products of every category and of its subcategories
+        self.categories: Dict[int, np.ndarray] = {}
+        self.food = np.packbits(np.zeros(self.size, dtype=bool))
+        for category_id in np.unique(category_ids).tolist():
+            bits = np.packbits(category_ids == category_id)
+            if products.is_food(category_id):
+                self.food |= bits
+            ancestor: Optional[int] = category_id
+            seen = set()
+            while ancestor is not None and ancestor not in seen:
+                seen.add(ancestor)
+                if ancestor in self.categories:
+                    self.categories[ancestor] = self.categories[ancestor] | bits
+                else:
+                    self.categories[ancestor] = bits
+                parent = products.categories.get(ancestor)
+                ancestor = None if parent is None else parent["parent_id"]
+
+    def _range(self, key: str, bounds: Range) -> Tuple[int, int]:
+        """Slice of the sorted positions of `key` within inclusive bounds."""
+        values, _, known = self.sorted[key]
+        low, high = bounds
+        start = 0 if low is None else int(np.searchsorted(values, low, "left"))
+        end = known if high is None else int(np.searchsorted(values, high, "right"))
+        return start, max(start, end)
+
+    def search(
+        self,
+        ranges: Dict[str, Range],
+        category_ids: Iterable[int] = (),
+        is_food: Optional[bool] = None,
+        sort: Optional[str] = "price",
+        descending: bool = False,
+        skip: int = 0,
+        limit: int = 100,
+        matches: Optional[Sequence[int]] = None,
+    ) -> List[int]:
+        """
+        Positions of the products within every range of `ranges`, in any of
+        `category_ids` and food or not as `is_food`, ordered by `sort`, with
+        unknown values last, then paged. Only `matches` are searched if given,
+        kept in their own order when `sort` is None.
+        """
+        if sort is None and matches is None:
+            raise ValueError("Searches without a sort key need matches")
+        bits: Optional[np.ndarray] = None
+
+        def restrict(other: np.ndarray):
+            nonlocal bits
+            bits = other if bits is None else bits & other
+
+        category_ids = list(category_ids)
+        if category_ids:
+            empty = np.zeros_like(self.food)
+            restrict(
+                np.bitwise_or.reduce(
+                    [
+                        self.categories.get(category_id, empty)
+                        for category_id in category_ids
+                    ]
+                )
+            )
+        if is_food is not None:
+            restrict(self.food if is_food else ~self.food)
+        for key, bounds in ranges.items():
+            if key != sort:
+                start, end = self._range(key, bounds)
+                in_range = np.zeros(self.size, dtype=bool)
+                in_range[self.sorted[key][1][start:end]] = True
+                restrict(np.packbits(in_range))
+
+        if matches is not None and sort is not None:
+            in_matches = np.zeros(self.size, dtype=bool)
+            in_matches[np.asarray(matches, dtype=np.int64)] = True
+            restrict(np.packbits(in_matches))
+
+        if sort is None:
+            walk = np.asarray(matches, dtype=np.int64)
+        else:
+            _, order, known = self.sorted[sort]
+            if sort in ranges:
+                start, end = self._range(sort, ranges[sort])
+                walk = order[start:end][::-1] if descending else order[start:end]
+            elif descending:
+                walk = np.concatenate([order[:known][::-1], order[known:]])
+            else:
+                walk = order
+        if bits is None:
+            return walk[skip : skip + limit].tolist()
+
+        # Walk the order in growing chunks until the page is full
+        selected = np.unpackbits(bits, count=self.size).view(bool)
+        wanted = skip + limit
+        found: List[int] = []
+        start, chunk = 0, max(4 * wanted, 1024)
+        while start < len(walk) and len(found) < wanted:
+            part = walk[start : start + chunk]
+            found.extend(part[selected[part]].tolist())
+            start += chunk
+            chunk *= 2
+        return found[skip:wanted]
+
+
+def search_index(products: CatalogSnapshot) -> SearchIndex:
+    """Search index of a catalog snapshot, built on first use."""
+    index = products.search_index
+    if index is None:
+        with products.index_lock:
+            index = products.search_index
+            if index is None:
+                index = products.search_index = SearchIndex(products)
+    return index
@@ -0,0 +1,404 @@
+"""
+Sharded product matching across long-lived processes.
+
+The catalog is split in `MATCHER_SHARDS` shards by a hash of the product ids,
+each one indexed by its own process. Queries and ticket batches are scattered
+to every shard, and the per-shard top matches are merged, so a single query
+uses all the cores while every shard scores on a single one.
+
+The shards are started and fed by one owner process, which must be allowed to
+have children: the Celery worker's main process before it forks its pool, see
+`app.worker`, or the API process for the in-process backends. Shards listen on
+local sockets, so every process forked from the owner afterwards, daemonic
+pool processes included, matches through connections of its own. The owner
+patches the shards with the changed products of its index, and restarts the
+shards that died; other processes fall back to matching in-process until then.
+"""
+
+import heapq
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import defaultdict
+from multiprocessing.connection import Client, Connection, Listener
+from typing import (
+    Any,
+    Collection,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from loguru import logger
+
+from app.models import ProductMatch
+from app.shared.product_matcher import (
+    MatchEngine,
+    ProductIndex,
+    default_engine,
+    hydrate_matches,
+    score_closest_products,
+    score_closest_products_batch,
+)
+
+# Number of shard processes, sharding is disabled below 2
+MATCHER_SHARDS = int(os.getenv("MATCHER_SHARDS", "1"))
+# Seconds between checks of the shards by their owner, see `app.worker`
+SHARD_CHECK_INTERVAL = float(os.getenv("MATCHER_SHARD_CHECK_INTERVAL", "5"))
+
+
+class ShardProduct(NamedTuple):
+    """Fields of a product a shard needs to score it."""
+
+    id: str
+    name: str
+    price: float
+
+
+def _serve_shard(address: str, authkey: bytes, owner_pid: int, ready: Connection):
+    """
+    Shard process: load a shard catalog and score queries against it, for
+    every connected process. Exits with its owner.
+    """
+    index = ProductIndex([])
+    lock = threading.Lock()
+
+    def positions(product_ids: Iterable[str]) -> set:
+        return {index.positions[i] for i in product_ids if i in index.positions}
+
+    def handle(command: str, payload: Any) -> Any:
+        nonlocal index
+        if command == "load":
+            index = ProductIndex(payload)
+            return len(index)
+        if command == "update":
+            index.update(payload)
+            return len(index)
+        if command == "match":
+            exclude = positions(payload.pop("exclude"))
+            scored = score_closest_products(index, exclude=exclude, **payload)
+            return [(score, index.ids[p]) for score, p in scored]
+        if command == "batch":
+            excludes = [
+                positions(product_ids) for product_ids in payload.pop("exclude")
+            ]
+            scored_batch = score_closest_products_batch(
+                index, exclude=excludes, workers=1, **payload
+            )
+            return [
+                [(score, index.ids[p]) for score, p in scored]
+                for scored in scored_batch
+            ]
+        raise ValueError(f"Unknown shard command: {command}")
+
+    def serve(connection: Connection):
+        with connection:
+            while True:
+                try:
+                    command, payload = connection.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    with lock:
+                        reply = handle(command, payload)
+                except Exception:
+                    logger.exception(f"Matcher shard failed to {command}")
+                    reply = None
+                connection.send(reply)
+
+    def watch_owner():
+        while os.getppid() == owner_pid:
+            time.sleep(1)
+        os._exit(0)
+
+    listener = Listener(address, family="AF_UNIX", authkey=authkey)
+    threading.Thread(target=watch_owner, daemon=True).start()
+    ready.send(True)
+    ready.close()
+    while True:
+        try:
+            connection = listener.accept()
+        except (multiprocessing.AuthenticationError, EOFError, ConnectionError):
+            continue
+        threading.Thread(target=serve, args=(connection,), daemon=True).start()
+
+
+def _merge(
+    index: ProductIndex, scored: List[List[Tuple[float, str]]], max_matches: int
+) -> List[Tuple[float, int]]:
+    """
+    Best (score, position) pairs of all shards, ties keeping catalog order.
+    Products missing from `index`, not loaded by this process yet, are skipped.
+    """
+    pairs = (
+        (score, index.positions.get(product_id))
+        for shard in scored
+        for score, product_id in shard
+    )
+    return heapq.nlargest(
+        max_matches,
+        ((score, p) for score, p in pairs if p is not None),
+        key=lambda pair: (pair[0], -pair[1]),
+    )
+
+
+class ShardedMatcher(MatchEngine):
+    """
+    Matching engine scattering queries over shard processes.
+
+    The shards are started by the first process loading an index or matching,
+    unless it is daemonic, and it owns them: it patches them whenever an update
+    of the loaded index is loaded or matched, reloads them for any other index,
+    and restarts the dead ones. Processes forked from the owner only match.
+    """
+
+    def __init__(self, shards: int = MATCHER_SHARDS):
+        self.shards = shards
+        self.addresses: List[str] = []
+        self.authkey = b""
+        self.processes: List[Any] = []
+        self.owner_pid: Optional[int] = None
+        # Index last loaded into the shards by the owner, and its generation
+        self.index: Optional[ProductIndex] = None
+        self.generation: Optional[int] = None
+        # Connections of `connections_pid` to every shard
+        self.connections: List[Connection] = []
+        self.connections_pid: Optional[int] = None
+        # Whether this process could not start the shards
+        self.refused = False
+        self.lock = threading.Lock()
+
+    def shard_of(self, product_id: str) -> int:
+        return zlib.crc32(product_id.encode()) % self.shards
+
+    @property
+    def is_owner(self) -> bool:
+        return self.owner_pid == os.getpid()
+
+    def _start(self) -> bool:
+        if multiprocessing.current_process().daemon:
+            if not self.refused:
+                logger.warning(
+                    "Daemonic processes can't start matcher shards, matching"
+                    " in-process"
+                )
+            self.refused = True
+            return False
+        directory = tempfile.mkdtemp(prefix="matcher-shards-")
+        self.addresses = [
+            os.path.join(directory, f"shard-{shard}") for shard in range(self.shards)
+        ]
+        self.authkey = os.urandom(32)
+        self.processes = [None] * self.shards
+        self.owner_pid = os.getpid()
+        self.index = self.generation = None
+        for shard in range(self.shards):
+            self._spawn(shard)
+        logger.info(f"Started {self.shards} matcher shard processes")
+        return True
+
+    def _spawn(self, shard: int):
+        address = self.addresses[shard]
+        if os.path.exists(address):
+            os.unlink(address)
+        context = multiprocessing.get_context("spawn")
+        ready_reader, ready_writer = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_serve_shard,
+            args=(address, self.authkey, os.getpid(), ready_writer),
+            daemon=True,
+        )
+        process.start()
+        ready_writer.close()
+        # Wait for the shard to listen
+        ready_reader.recv()
+        ready_reader.close()
+        self.processes[shard] = process
+
+    def _connect(self) -> List[Connection]:
+        if self.connections_pid != os.getpid():
+            # Connections inherited from the parent process are its own
+            self.connections = []
+            self.connections_pid = os.getpid()
+        if not self.connections:
+            self.connections = [
+                Client(address, family="AF_UNIX", authkey=self.authkey)
+                for address in self.addresses
+            ]
+        return self.connections
+
+    def _disconnect(self):
+        if self.connections_pid == os.getpid():
+            for connection in self.connections:
+                connection.close()
+        self.connections = []
+
+    def _send(self, sends: Dict[int, Tuple[str, Any]]) -> Dict[int, Any]:
+        """Send commands to shards, then gather the replies."""
+        connections = self._connect()
+        for shard, message in sends.items():
+            connections[shard].send(message)
+        return {shard: connections[shard].recv() for shard in sends}
+
+    def _partition(
+        self, index: ProductIndex, positions: Iterable[int]
+    ) -> Dict[int, List[ShardProduct]]:
+        by_shard: Dict[int, List[ShardProduct]] = defaultdict(list)
+        for p in positions:
+            by_shard[self.shard_of(index.ids[p])].append(
+                ShardProduct(index.ids[p], index.names[p], index.prices[p])
+            )
+        return by_shard
+
+    def _restart_dead(self):
+        dead = [
+            shard
+            for shard, process in enumerate(self.processes)
+            if not process.is_alive()
+        ]
+        if not dead:
+            return
+        self._disconnect()
+        for shard in dead:
+            logger.error(f"Matcher shard {shard} died, restarting it")
+            self._spawn(shard)
+        if self.index is not None:
+            by_shard = self._partition(self.index, range(len(self.index)))
+            self._send({shard: ("load", by_shard[shard]) for shard in dead})
+
+    def _sync(self, index: ProductIndex):
+        if self.generation == index.generation:
+            return
+        changed = index.changed_since(self.generation) if index is self.index else None
+        if changed is None:
+            by_shard = self._partition(index, range(len(index)))
+            self._send(
+                {shard: ("load", by_shard[shard]) for shard in range(self.shards)}
+            )
+            logger.info(f"Loaded {len(index)} products into {self.shards} shards")
+        else:
+            by_shard = self._partition(index, changed)
+            self._send({shard: ("update", by_shard[shard]) for shard in by_shard})
+            logger.info(f"Updated {len(changed)} products in {len(by_shard)} shards")
+        self.index, self.generation = index, index.generation
+
+    def load(self, index: ProductIndex):
+        """
+        Start the shard processes if needed, then, in their owner, restart the
+        dead ones and load the index into them. A no-op in other processes.
+        """
+        with self.lock:
+            if not self.addresses and not self._start():
+                return
+            if not self.is_owner:
+                return
+            try:
+                self._restart_dead()
+                self._sync(index)
+            except (EOFError, OSError) as error:
+                self._disconnect()
+                logger.error(f"Failed to load the matcher shards: {error!r}")
+
+    def close(self):
+        """Stop the shard processes if owned, else disconnect from them."""
+        with self.lock:
+            self._disconnect()
+            if self.is_owner:
+                for process in self.processes:
+                    process.terminate()
+                    process.join()
+                shutil.rmtree(os.path.dirname(self.addresses[0]), ignore_errors=True)
+                self.addresses, self.processes = [], []
+                self.owner_pid = self.index = self.generation = None
+
+    def _scatter(
+        self, index: ProductIndex, command: str, payload: dict
+    ) -> Optional[list]:
+        """
+        Replies of every shard to a command, None when a shard can't answer,
+        after a retry restarting the dead shards in the owner.
+        """
+        with self.lock:
+            if not self.addresses and not self._start():
+                return None
+            for _ in range(2):
+                try:
+                    if self.is_owner:
+                        self._restart_dead()
+                        self._sync(index)
+                    replies = self._send(
+                        {shard: (command, payload) for shard in range(self.shards)}
+                    )
+                except (EOFError, OSError) as error:
+                    self._disconnect()
+                    logger.warning(f"Lost the matcher shards: {error!r}")
+                    continue
+                if any(reply is None for reply in replies.values()):
+                    return None
+                return [replies[shard] for shard in range(self.shards)]
+            return None
+
+    def match(
+        self,
+        index: ProductIndex,
+        item_name: Optional[str],
+        item_price: Optional[float],
+        threshold: float,
+        max_matches: int,
+        exclude: Collection[int] = (),
+    ) -> List[ProductMatch]:
+        scored = self._scatter(
+            index,
+            "match",
+            dict(
+                item_name=item_name,
+                item_price=item_price,
+                threshold=threshold,
+                max_matches=max_matches,
+                exclude=[index.ids[p] for p in exclude],
+            ),
+        )
+        if scored is None:
+            return default_engine.match(
+                index, item_name, item_price, threshold, max_matches, exclude
+            )
+        return hydrate_matches(index, _merge(index, scored, max_matches))
+
+    def match_batch(
+        self,
+        index: ProductIndex,
+        items: Sequence[Tuple[Optional[str], Optional[float]]],
+        threshold: float,
+        max_matches: int,
+        exclude: Optional[Sequence[Collection[int]]] = None,
+    ) -> List[List[ProductMatch]]:
+        excludes = list(exclude) if exclude else [() for _ in items]
+        scored = self._scatter(
+            index,
+            "batch",
+            dict(
+                items=list(items),
+                threshold=threshold,
+                max_matches=max_matches,
+                exclude=[[index.ids[p] for p in positions] for positions in excludes],
+            ),
+        )
+        if scored is None:
+            return default_engine.match_batch(
+                index, items, threshold, max_matches, exclude
+            )
+        return [
+            hydrate_matches(index, _merge(index, list(item_scored), max_matches))
+            for item_scored in zip(*scored)
+        ]
+
+
+sharded_matcher = ShardedMatcher() if MATCHER_SHARDS > 1 else None
@@ -0,0 +1,284 @@
+"""
+Character n-gram TF-IDF product matching.
+
+Catalog names are embedded once per catalog generation as L2 normalized TF-IDF
+vectors of their character trigrams, kept in a sparse matrix. A query, or a whole
+ticket batch, is scored against every product with a single sparse product whose
+cosine similarities stand in for the fuzzy name score. The best candidates are
+then re-ranked with the fuzzy score, so their scores and thresholds are on the
+same scale as the default engine's.
+
+Updates of the index only re-embed the patched names, with the IDF of the last
+full build, until they amount to `TFIDF_REBUILD_RATIO` of the catalog.
+"""
+
+import math
+import os
+import threading
+from collections import Counter
+from typing import Collection, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fuzzywuzzy import fuzz
+from loguru import logger
+
+from app.models import ProductMatch
+from app.shared.product_matcher import (
+    NAME_WEIGHT,
+    PRICE_WEIGHT,
+    MatchEngine,
+    ProductIndex,
+    hydrate_matches,
+    normalize_name,
+    price_score_matrix,
+)
+
+# Length of the character n-grams names are embedded with
+TFIDF_NGRAM = 3
+# Number of best TF-IDF candidates re-ranked with the fuzzy score. 0 disables
+# it, leaving scores on the cosine scale, which the fuzzy thresholds don't fit
+TFIDF_RERANK = int(os.getenv("MATCHER_TFIDF_RERANK", "50"))
+# Share of re-embedded names above which the matrix is rebuilt, refreshing the IDF
+TFIDF_REBUILD_RATIO = 0.1
+
+
+def char_ngrams(name: str, n: int = TFIDF_NGRAM) -> Counter[str]:
+    """Counts of the character n-grams of a normalized name, padded with spaces."""
+    padded = f" {name} "
+    return Counter(padded[i : i + n] for i in range(len(padded) - n + 1))
+
+
+class TfidfMatrix:
+    """
+    Sparse TF-IDF matrix of the character n-grams of a list of names.
+
+    Stored in compressed sparse column layout: the rows (name positions) holding
+    n-gram `j` are `indices[indptr[j]:indptr[j + 1]]`, with weights in `data`
+    at the same offsets, so a product only touches the columns of the query's
+    n-grams. Term frequencies are sublinear and the IDF is smoothed.
+
+    Names changed or added by `update` are embedded apart, in `overlay`, and
+    replace their rows of the compressed matrix.
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.size = len(names)
+        self.vocabulary: dict[str, int] = {}
+        rows, columns, counts = [], [], []
+        for row, name in enumerate(names):
+            for gram, count in char_ngrams(name).items():
+                rows.append(row)
+                columns.append(self.vocabulary.setdefault(gram, len(self.vocabulary)))
+                counts.append(count)
+
+        row_array = np.array(rows, dtype=np.int32)
+        column_array = np.array(columns, dtype=np.int32)
+        document_frequency = np.bincount(column_array, minlength=len(self.vocabulary))
+        self.idf = np.log((1 + self.size) / (1 + document_frequency)) + 1
+        # Weight of n-grams missing from the catalog, only matters for query norms
+        self.unknown_idf = math.log(1 + self.size) + 1
+
+        weights = (1 + np.log(np.array(counts, dtype=np.float64))) * self.idf[
+            column_array
+        ]
+        norms = np.sqrt(np.bincount(row_array, weights**2, minlength=self.size))
+        weights /= norms[row_array]
+
+        order = np.argsort(column_array, kind="stable")
+        self.indices = row_array[order]
+        self.data = weights[order]
+        self.indptr = np.zeros(len(self.vocabulary) + 1, dtype=np.int64)
+        np.cumsum(document_frequency, out=self.indptr[1:])
+
+        # Rows of the compressed matrix, the ones in `patched` are replaced
+        self.base_size = self.size
+        # Columns of every updated row, and weights of the updated rows by column
+        self.patched: dict[int, List[int]] = {}
+        self.overlay: dict[int, dict[int, float]] = {}
+
+    def update(self, names: dict[int, str]):
+        """Re-embed the names of changed rows, or of new rows past the end."""
+        for row, name in sorted(names.items()):
+            self.size = max(self.size, row + 1)
+            for column in self.patched.pop(row, ()):
+                del self.overlay[column][row]
+            grams = char_ngrams(name)
+            new_grams = [gram for gram in grams if gram not in self.vocabulary]
+            if new_grams:
+                for gram in new_grams:
+                    self.vocabulary[gram] = len(self.vocabulary)
+                # Smoothed IDF of n-grams of a single name
+                self.idf = np.concatenate(
+                    [
+                        self.idf,
+                        np.full(len(new_grams), math.log((1 + self.size) / 2) + 1),
+                    ]
+                )
+            columns = [self.vocabulary[gram] for gram in grams]
+            weights = (
+                1 + np.log(np.array(list(grams.values()), dtype=np.float64))
+            ) * self.idf[columns]
+            norm = math.sqrt(float(np.sum(weights**2)))
+            for column, weight in zip(columns, weights.tolist()):
+                self.overlay.setdefault(column, {})[row] = weight / norm
+            self.patched[row] = columns
+
+    def vectorize(self, name: str) -> Tuple[List[int], np.ndarray]:
+        """Columns and L2 normalized weights of the n-grams of a name in the catalog."""
+        columns, weights, norm = [], [], 0.0
+        for gram, count in char_ngrams(name).items():
+            column = self.vocabulary.get(gram)
+            idf = self.idf[column] if column is not None else self.unknown_idf
+            weight = (1 + math.log(count)) * idf
+            norm += weight**2
+            if column is not None:
+                columns.append(column)
+                weights.append(weight)
+        return columns, np.array(weights) / math.sqrt(norm) if norm else np.array([])
+
+    def similarities(self, names: Sequence[str]) -> np.ndarray:
+        """Cosine similarities of every name with every catalog name, in [0, 1]."""
+        scores = np.zeros((len(names), self.size))
+        query_columns: dict[int, List[Tuple[int, float]]] = {}
+        for row, name in enumerate(names):
+            for column, weight in zip(*self.vectorize(name)):
+                query_columns.setdefault(column, []).append((row, weight))
+        # Columns shared by several queries are only gathered once
+        compressed_columns = len(self.indptr) - 1
+        for column, entries in query_columns.items():
+            if column >= compressed_columns:
+                continue
+            start, end = self.indptr[column], self.indptr[column + 1]
+            query_rows = np.array([row for row, _ in entries])
+            query_weights = np.array([weight for _, weight in entries])
+            scores[np.ix_(query_rows, self.indices[start:end])] += np.outer(
+                query_weights, self.data[start:end]
+            )
+        if self.patched:
+            scores[:, [row for row in self.patched if row < self.base_size]] = 0.0
+            for column, entries in query_columns.items():
+                rows = self.overlay.get(column)
+                if rows:
+                    query_rows = np.array([row for row, _ in entries])
+                    query_weights = np.array([weight for _, weight in entries])
+                    scores[np.ix_(query_rows, np.array(list(rows)))] += np.outer(
+                        query_weights, np.array(list(rows.values()))
+                    )
+        return scores
+
+
+class TfidfMatcher(MatchEngine):
+    """
+    Match engine scoring names by the cosine similarity of their TF-IDF vectors.
+
+    The matrix is built lazily for every new index, and patched with the names
+    changed by its updates. The best `rerank` candidates by TF-IDF score are
+    re-scored with the same fuzzy name score as the default engine, so the
+    same thresholds apply. Without re-ranking, names are scored by cosine
+    similarity times 100, lower than fuzzy scores for the same names.
+    """
+
+    name = "tfidf"
+
+    def __init__(self, rerank: int = TFIDF_RERANK):
+        self.rerank = rerank
+        self.matrix = TfidfMatrix([])
+        self.generation: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def load(self, index: ProductIndex) -> TfidfMatrix:
+        with self.lock:
+            if self.generation == index.generation:
+                return self.matrix
+            changed = index.changed_since(self.generation)
+            if changed is not None and len(self.matrix.patched) + len(
+                changed
+            ) <= TFIDF_REBUILD_RATIO * len(index):
+                self.matrix.update({p: index.names[p] for p in changed})
+                logger.info(f"Updated {len(changed)} names of the TF-IDF matrix")
+            else:
+                self.matrix = TfidfMatrix(index.names)
+                logger.info(
+                    f"Built TF-IDF matrix of {len(self.matrix.vocabulary)} n-grams"
+                )
+            self.generation = index.generation
+            return self.matrix
+
+    def score(
+        self,
+        index: ProductIndex,
+        items: Sequence[Tuple[Optional[str], Optional[float]]],
+        threshold: float,
+        max_matches: int,
+        exclude: Optional[Sequence[Collection[int]]] = None,
+    ) -> List[List[Tuple[float, int]]]:
+        """Best (score, position) pairs of the index for every item, best first."""
+        if not len(index) or not items:
+            return [[] for _ in items]
+
+        query_names = [normalize_name(name) if name else "" for name, _ in items]
+        price_scores = price_score_matrix(index, [price for _, price in items])
+        combined_scores = (
+            self.load(index).similarities(query_names) * 100 * NAME_WEIGHT
+            + price_scores * PRICE_WEIGHT
+        )
+        for row, excluded in enumerate(exclude or ()):
+            combined_scores[row, list(excluded)] = -np.inf
+
+        candidates = min(max(max_matches, self.rerank), len(index))
+        top = np.argpartition(-combined_scores, candidates - 1, axis=1)[:, :candidates]
+
+        results = []
+        for row, (query_name, positions) in enumerate(zip(query_names, top)):
+            scored = []
+            for position in positions.tolist():
+                score = combined_scores[row, position]
+                if self.rerank and score != -np.inf:
+                    product_name = index.names[position]
+                    name_score = (
+                        fuzz.token_set_ratio(
+                            query_name, product_name, full_process=False
+                        )
+                        if query_name and product_name
+                        else 0
+                    )
+                    score = (
+                        name_score * NAME_WEIGHT
+                        + price_scores[row, position] * PRICE_WEIGHT
+                    )
+                if score >= threshold:
+                    scored.append((float(score), position))
+            scored.sort(key=lambda entry: (-entry[0], entry[1]))
+            results.append(scored[:max_matches])
+        return results
+
+    def match(
+        self,
+        index: ProductIndex,
+        item_name: Optional[str],
+        item_price: Optional[float],
+        threshold: float,
+        max_matches: int,
+        exclude: Collection[int] = (),
+    ) -> List[ProductMatch]:
+        (scored,) = self.score(
+            index, [(item_name, item_price)], threshold, max_matches, [exclude]
+        )
+        return hydrate_matches(index, scored)
+
+    def match_batch(
+        self,
+        index: ProductIndex,
+        items: Sequence[Tuple[Optional[str], Optional[float]]],
+        threshold: float,
+        max_matches: int,
+        exclude: Optional[Sequence[Collection[int]]] = None,
+    ) -> List[List[ProductMatch]]:
+        logger.info(f"Processing TF-IDF matching of {len(items)} items")
+        return [
+            hydrate_matches(index, scored)
+            for scored in self.score(index, items, threshold, max_matches, exclude)
+        ]
+
+
+tfidf_matcher = TfidfMatcher()
@@ -1,38 +1,126 @@
+from celery import bootsteps
+from celery.signals import worker_init, worker_process_init
 from loguru import logger
 
 from app.celery_config import celery_app
-from app.database import get_session
+from app.database import get_engine, get_session
 from app.models import WrongMatchReport, WrongNutritionReport
+from app.shared.aliases import AliasTable, confirm_alias
 from app.shared.cache import get_all_products
-from app.shared.product_matcher import find_closest_products_task
+from app.shared.catalog import memory_report
+from app.shared.index_refresh import IndexRefresher
+from app.shared.matching import match_engines
+from app.shared.product_matcher import (
+    ProductIndex,
+    find_closest_products_batch_cached,
+    find_closest_products_cached,
+)
+from app.shared.sharded_matcher import SHARD_CHECK_INTERVAL, sharded_matcher
 
-products = []
+product_index = ProductIndex([])
+# Patches the index with the changed products, filling it if never preloaded
+refresher = IndexRefresher(product_index)
+aliases = AliasTable()
 
 
-@celery_app.on_after_configure.connect
-def setup_periodic_tasks(sender, **kwargs):
-    sender.add_periodic_task(
-        3600.0, reload_products.s(), name="reload products every hour"
+def load_index():
+    global product_index, refresher
+    product_index = ProductIndex(get_all_products(next(get_session())))
+    refresher = IndexRefresher(product_index, product_index.products.last_updated)
+    logger.info(
+        f"Preloaded {len(product_index)} products for matching:"
+        f" {memory_report(product_index.products)}"
     )
 
 
-@celery_app.task
-def reload_products():
-    global products
-    products = get_all_products(next(get_session()))
-    logger.info(f"Reloaded {len(products)} products for matching")
+@worker_init.connect
+def start_shards(**kwargs):
+    """
+    With sharded matching, load the catalog and start the matcher shards in the
+    main worker process, before it forks the pool: pool processes are daemonic
+    and can't have children. They inherit the loaded catalog.
+    """
+    if sharded_matcher is None:
+        return
+    load_index()
+    sharded_matcher.load(product_index)
+    # Pool processes must not share the database connections of the main one
+    get_engine().dispose()
+
+
+def supervise_shards():
+    """Restart the dead matcher shards and patch them with the catalog changes."""
+    refresher.maybe_refresh(lambda: next(get_session()))
+    sharded_matcher.load(product_index)
+
+
+class ShardSupervisor(bootsteps.StartStopStep):
+    """Runs `supervise_shards` on the timer of the main worker process."""
+
+    requires = {"celery.worker.components:Timer"}
+    timer_ref = None
+
+    def include_if(self, worker):
+        return sharded_matcher is not None
 
+    def start(self, worker):
+        self.timer_ref = worker.timer.call_repeatedly(
+            SHARD_CHECK_INTERVAL, supervise_shards, priority=10
+        )
 
-# Preload products when worker starts
-products = get_all_products(next(get_session()))
-logger.info(f"Preloaded {len(products)} products for matching")
+    def stop(self, worker):
+        if self.timer_ref is not None:
+            self.timer_ref.cancel()
+        sharded_matcher.close()
+
+
+celery_app.steps["worker"].add(ShardSupervisor)
+
+
+@worker_process_init.connect
+def preload_products(**kwargs):
+    """
+    Preload products when a worker process starts, not on import: the API
+    imports this module's task names through Celery only.
+    """
+    get_engine().dispose(close=False)
+    if len(product_index):
+        # Loaded by the main process, see `start_shards`
+        return
+    load_index()
+
+
+def refresh():
+    """Catch up with the catalog and alias changes, in the worker process."""
+    refresher.maybe_refresh(lambda: next(get_session()))
+    aliases.maybe_refresh(lambda: next(get_session()))
 
 
 @celery_app.task
-def find_closest_products_with_preload(*args, **kwargs):
+def find_closest_products_with_preload(engine: str = "fuzzy", **kwargs):
+    refresh()
     return [
         result.model_dump()
-        for result in find_closest_products_task(products, *args, **kwargs)
+        for result in find_closest_products_cached(
+            product_index,
+            aliases=aliases,
+            engine=match_engines[engine],
+            **kwargs,
+        )
+    ]
+
+
+@celery_app.task
+def find_closest_products_batch_with_preload(engine: str = "fuzzy", **kwargs):
+    refresh()
+    return [
+        [result.model_dump() for result in results]
+        for results in find_closest_products_batch_cached(
+            product_index,
+            aliases=aliases,
+            engine=match_engines[engine],
+            **kwargs,
+        )
     ]
 
 
@@ -41,7 +129,10 @@ def find_closest_products_with_preload(*args, **kwargs):
     max_retries=5,
 )
 def process_wrong_match_report(
-    original_name: str, original_price: float, wrong_match_id: str
+    original_name: str,
+    original_price: float,
+    wrong_match_id: str,
+    source: str | None = None,
 ):
     try:
         with next(get_session()) as session:
@@ -49,6 +140,7 @@ def process_wrong_match_report(
                 original_name=original_name,
                 original_price=original_price,
                 wrong_match_id=wrong_match_id,
+                source=source,
             )
             session.add(report)
             session.commit()
@@ -74,3 +166,20 @@ def process_wrong_nutrition_report(product_id: str, nutrition_id: int):
     except Exception as e:
         logger.error(f"Error saving wrong nutrition report: {str(e)}")
         raise
+
+
+@celery_app.task(
+    default_retry_delay=30,
+    max_retries=5,
+)
+def process_confirmed_match(original_name: str, product_id: str, source: str):
+    try:
+        with next(get_session()) as session:
+            alias = confirm_alias(session, original_name, product_id, source)
+            logger.info(
+                f"Saved confirmation of '{alias.name}' for product {product_id},"
+                f" aliased to {alias.product_id} by {alias.confirmations}"
+            )
+    except Exception as e:
+        logger.error(f"Error saving confirmed match: {str(e)}")
+        raise
@@ -0,0 +1,88 @@
+"""
+Benchmark the memory of the cached catalog: detached ORM products against a
+columnar `CatalogSnapshot` of the same products, built in memory or mapped
+from a snapshot file. Runs fully offline, from the repository root:
+
+    python -m benchmarks.catalog --catalog-size 10000 --history 52
+"""
+
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from loguru import logger
+
+from app.models import ProductPublic
+from app.shared.catalog import CatalogSnapshot
+from benchmarks.synthetic import make_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument(
+        "--history", type=int, default=52, help="price history entries per product"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logger.remove()
+
+    tracemalloc.start()
+    products = make_catalog(args.catalog_size, seed=args.seed, history=args.history)
+    gc.collect()
+    orm_bytes, _ = tracemalloc.get_traced_memory()
+
+    start = time.perf_counter()
+    snapshot = CatalogSnapshot(products)
+    build_time = time.perf_counter() - start
+    del products
+    gc.collect()
+    snapshot_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "catalog.snapshot")
+        snapshot.write(path, generation=1)
+        tracemalloc.start()
+        start = time.perf_counter()
+        mapped = CatalogSnapshot.open(path)
+        open_time = time.perf_counter() - start
+        # Touch every column, as matching and serving do over time
+        for array in mapped.arrays().values():
+            array.sum()
+        mapped_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        file_size = os.path.getsize(path)
+        del mapped
+
+    start = time.perf_counter()
+    for position in range(0, len(snapshot), max(1, len(snapshot) // 1000)):
+        ProductPublic.model_validate(snapshot[position])
+    materialized = len(range(0, len(snapshot), max(1, len(snapshot) // 1000)))
+    materialize_time = (time.perf_counter() - start) / materialized
+
+    print(
+        f"catalog: {len(snapshot)} products,"
+        f" {len(snapshot.history_price)} price history entries"
+    )
+    print(f"ORM products:      {orm_bytes / 1024 / 1024:8.1f} MiB traced")
+    print(
+        f"catalog snapshot:  {snapshot_bytes / 1024 / 1024:8.1f} MiB traced,"
+        f" {snapshot.nbytes / 1024 / 1024:.1f} MiB of columns"
+    )
+    print(
+        f"mapped snapshot:   {mapped_bytes / 1024 / 1024:8.1f} MiB traced,"
+        f" {file_size / 1024 / 1024:.1f} MiB file shared by all processes"
+    )
+    print(f"snapshot build:    {build_time * 1000:8.0f} ms")
+    print(f"snapshot open:     {open_time * 1000:8.2f} ms")
+    print(f"materialize:       {materialize_time * 1000:8.3f} ms per product")
+
+
+if __name__ == "__main__":
+    main()
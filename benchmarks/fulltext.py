@@ -0,0 +1,89 @@
+"""
+Benchmark full-text typeahead lookups: FTS5 prefix queries ranked by BM25
+against an unranked `LIKE` scan of the product names, which stops at the first
+matches, on a synthetic catalog in a temporary SQLite database. Runs fully
+offline, from the repository root:
+
+    python -m benchmarks.fulltext --catalog-size 20000 --queries 200
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from loguru import logger
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine
+
+from app.shared.fulltext import rebuild_product_fts, search_product_ids
+from benchmarks.synthetic import make_catalog
+
+
+def typeahead_queries(names, count, rng):
+    """Prefixes of one or two words of product names, as typed."""
+    queries = []
+    for name in rng.sample(names, count):
+        words = name.split()[: rng.randint(1, 2)]
+        words[-1] = words[-1][: rng.randint(2, max(2, len(words[-1])))]
+        queries.append(" ".join(words))
+    return queries
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--catalog-size", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logger.remove()
+
+    products = make_catalog(args.catalog_size, seed=args.seed)
+    queries = typeahead_queries(
+        [product.name for product in products],
+        args.queries,
+        random.Random(args.seed),
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        SQLModel.metadata.create_all(engine)
+        with Session(engine) as session:
+            session.add_all(products)
+            session.commit()
+            start = time.perf_counter()
+            rebuild_product_fts(session)
+            build_time = time.perf_counter() - start
+
+            def fts(query):
+                return search_product_ids(session, query, limit=args.limit)
+
+            def like(query):
+                return session.exec(
+                    text("SELECT id FROM product WHERE name LIKE :q LIMIT :limit"),
+                    params={"q": f"%{query}%", "limit": args.limit},
+                ).all()
+
+            print(f"catalog: {args.catalog_size} products, {len(queries)} queries")
+            print(f"index build: {build_time * 1000:.0f} ms")
+            print(f"{'':<16} {'median ms':>10} {'p95 ms':>8} {'hits':>6}")
+            for name, lookup in (("FTS5 prefix", fts), ("LIKE scan", like)):
+                times, hits = [], 0
+                for query in queries:
+                    start = time.perf_counter()
+                    hits += bool(lookup(query))
+                    times.append(time.perf_counter() - start)
+                times.sort()
+                print(
+                    f"{name:<16} {statistics.median(times) * 1000:10.2f}"
+                    f" {times[int(len(times) * 0.95)] * 1000:8.2f}"
+                    f" {hits:6d}"
+                )
+
+
+if __name__ == "__main__":
+    main()
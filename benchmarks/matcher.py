@@ -0,0 +1,279 @@
+"""
+Benchmark product matching speed and quality on a synthetic receipt corpus.
+
+Every engine is compared against the original brute-force matcher on the same
+noisy ticket lines, reporting queries/sec, p50/p95 latency, peak traced memory
+and recall@1/@5. Runs fully offline, from the repository root:
+
+    python -m benchmarks.matcher --catalog-size 10000 --queries 100
+"""
+
+import argparse
+import statistics
+import time
+import tracemalloc
+from typing import Callable, List, Optional
+
+import unidecode
+from fuzzywuzzy import fuzz
+from loguru import logger
+
+from app.models import ProductMatch, ProductPublic
+from app.shared.product_matcher import (
+    ProductIndex,
+    find_closest_products_batch,
+    find_closest_products_task,
+)
+from app.shared.sharded_matcher import ShardedMatcher
+from app.shared.tfidf_matcher import TfidfMatcher
+from benchmarks.synthetic import ReceiptQuery, make_catalog, make_receipt_queries
+
+TICKET_SIZE = 30
+
+
+def brute_force_matches(
+    products: List,
+    item_name: Optional[str] = None,
+    item_price: Optional[float] = None,
+    threshold: float = 60.0,
+    max_matches: int = 10,
+) -> List[ProductMatch]:
+    """Matcher as it was before any indexing, kept as the reference baseline."""
+    matches = []
+    for product in products:
+        name_score: float = 0.0
+        price_score: float = 0.0
+        if item_name is not None:
+            name_score = fuzz.token_set_ratio(
+                unidecode.unidecode(item_name.lower()),
+                unidecode.unidecode(product.name.lower()),
+            )
+        if item_price:
+            price_diff = abs(product.price - item_price)
+            price_score = max(0, 100 - (price_diff / item_price) * 100)
+        combined_score = (name_score * 0.7) + (price_score * 0.3)
+        if combined_score >= threshold:
+            matches.append(
+                ProductMatch(
+                    score=combined_score, product=ProductPublic.model_validate(product)
+                )
+            )
+    matches.sort(key=lambda x: x.score, reverse=True)
+    return matches[:max_matches]
+
+
+def run(
+    match_batch: Callable[[List[ReceiptQuery]], List[List[ProductMatch]]],
+    queries: List[ReceiptQuery],
+    batch_size: int,
+) -> tuple[List[float], List[List[ProductMatch]]]:
+    """Per-query latencies in seconds and results, `batch_size` queries per call."""
+    latencies, results = [], []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start : start + batch_size]
+        started = time.perf_counter()
+        results.extend(match_batch(batch))
+        latencies.extend([(time.perf_counter() - started) / len(batch)] * len(batch))
+    return latencies, results
+
+
+def peak_memory(
+    match_batch: Callable[[List[ReceiptQuery]], List[List[ProductMatch]]],
+    queries: List[ReceiptQuery],
+    batch_size: int,
+) -> int:
+    """Peak traced memory in bytes while running the queries."""
+    tracemalloc.start()
+    run(match_batch, queries, batch_size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def recall_at(
+    k: int, queries: List[ReceiptQuery], results: List[List[ProductMatch]]
+) -> float:
+    hits = sum(
+        any(match.product.id == query.product_id for match in matches[:k])
+        for query, matches in zip(queries, results)
+    )
+    return hits / len(queries)
+
+
+def report(name: str, engine, queries: List[ReceiptQuery], args, batch_size: int = 1):
+    latencies, results = run(engine, queries, batch_size)
+    peak = peak_memory(engine, queries[: args.memory_queries], batch_size)
+    quantiles = statistics.quantiles(latencies, n=20)
+    print(
+        f"{name:<24} {len(latencies) / sum(latencies):9.1f}"
+        f" {statistics.median(latencies) * 1000:9.2f}"
+        f" {quantiles[18] * 1000:9.2f}"
+        f" {peak / 1024:10.0f}"
+        f" {recall_at(1, queries, results):9.3f}"
+        f" {recall_at(5, queries, results):9.3f}"
+    )
+
+
+def single(match: Callable[..., List[ProductMatch]], **kwargs):
+    """Adapt a single query matcher to a list of queries."""
+    return lambda batch: [
+        match(item_name=query.name, item_price=query.price, max_matches=5, **kwargs)
+        for query in batch
+    ]
+
+
+def micro_benchmarks(products: List, index: ProductIndex, queries: List[tuple]):
+    """Threshold and price-only micro-benchmarks of the single query matcher."""
+
+    def time_queries(match: Callable, queries: List[tuple]) -> float:
+        start = time.perf_counter()
+        for name, price in queries:
+            match(item_name=name, item_price=price)
+        return (time.perf_counter() - start) * 1000 / len(queries)
+
+    def peak(match: Callable, queries: List[tuple]) -> float:
+        tracemalloc.start()
+        time_queries(match, queries)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak / 1024
+
+    print()
+    print("threshold   brute ms/q   index ms/q   brute peak KiB   index peak KiB")
+    for threshold in (0, 30, 60):
+        brute = lambda **kwargs: brute_force_matches(  # noqa: E731
+            products, threshold=threshold, **kwargs
+        )
+        indexed = lambda **kwargs: find_closest_products_task(  # noqa: E731
+            index, threshold=threshold, **kwargs
+        )
+        print(
+            f"{threshold:>9} {time_queries(brute, queries):12.2f}"
+            f" {time_queries(indexed, queries):12.2f}"
+            f" {peak(brute, queries):16.0f} {peak(indexed, queries):16.0f}"
+        )
+
+    price_queries = [(None, price) for _, price in queries]
+    brute = lambda **kwargs: brute_force_matches(  # noqa: E731
+        products, threshold=28, **kwargs
+    )
+    indexed = lambda **kwargs: find_closest_products_task(  # noqa: E731
+        index, threshold=28, **kwargs
+    )
+    print(
+        f"price only (threshold 28): brute {time_queries(brute, price_queries):.2f}"
+        f" ms/q, price window {time_queries(indexed, price_queries):.2f} ms/q"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument(
+        "--memory-queries",
+        type=int,
+        default=TICKET_SIZE,
+        help="queries traced for peak memory, tracing is slow",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=0, help="also bench sharding")
+    parser.add_argument(
+        "--skip-baseline", action="store_true", help="skip the brute-force matcher"
+    )
+    parser.add_argument(
+        "--micro", action="store_true", help="run the micro-benchmarks too"
+    )
+    args = parser.parse_args()
+
+    logger.remove()
+    products = make_catalog(args.catalog_size, seed=args.seed)
+    queries = make_receipt_queries(products, args.queries, seed=args.seed)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    index = ProductIndex(products)
+    build_time = time.perf_counter() - start
+    _, build_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"catalog: {len(products)} products, {len(queries)} receipt queries")
+    print(
+        f"index build: {build_time * 1000:.0f} ms, {build_peak / 1024 / 1024:.1f} MiB"
+    )
+    print(
+        f"{'engine':<24} {'q/s':>9} {'p50 ms':>9} {'p95 ms':>9}"
+        f" {'peak KiB':>10} {'recall@1':>9} {'recall@5':>9}"
+    )
+    if not args.skip_baseline:
+        report(
+            "brute force", single(brute_force_matches, products=products), queries, args
+        )
+    report(
+        "index, full scan",
+        single(
+            find_closest_products_task, products=index, min_candidates=len(index) + 1
+        ),
+        queries,
+        args,
+    )
+    report(
+        "index, prefiltered",
+        single(find_closest_products_task, products=index),
+        queries,
+        args,
+    )
+    report(
+        "batch",
+        lambda batch: find_closest_products_batch(
+            index, [(query.name, query.price) for query in batch], max_matches=5
+        ),
+        queries,
+        args,
+        batch_size=TICKET_SIZE,
+    )
+    for name, tfidf in (
+        ("tfidf", TfidfMatcher(rerank=0)),
+        ("tfidf, reranked", TfidfMatcher(rerank=50)),
+    ):
+        tfidf.load(index)
+        report(
+            name,
+            lambda batch: [
+                tfidf.match(index, query.name, query.price, 60.0, 5) for query in batch
+            ],
+            queries,
+            args,
+        )
+        report(
+            f"{name}, batch",
+            lambda batch: tfidf.match_batch(
+                index, [(query.name, query.price) for query in batch], 60.0, 5
+            ),
+            queries,
+            args,
+            batch_size=TICKET_SIZE,
+        )
+    if args.shards > 1:
+        sharded = ShardedMatcher(args.shards)
+        sharded.load(index)
+        report(
+            f"sharded x{args.shards}",
+            lambda batch: sharded.match_batch(
+                index, [(query.name, query.price) for query in batch], 60.0, 5
+            ),
+            queries,
+            args,
+            batch_size=TICKET_SIZE,
+        )
+        sharded.close()
+
+    if args.micro:
+        sample = [(query.name, query.price) for query in queries[:5]]
+        micro_benchmarks(products, index, sample)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark product lookups through the API: N `GET /products/{id}` calls against
+a single `POST /products/batch` call for the same products, and the payload of
+product listings by field projection, on a synthetic catalog served from the
+cache. Runs fully offline, from the repository root:
+
+    python -m benchmarks.products --catalog-size 10000 --lookups 100
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from loguru import logger
+
+from app.database import get_session
+from app.routers import products as products_router
+from app.shared.cache import cache
+from app.shared.catalog import CatalogSnapshot
+from benchmarks.synthetic import make_catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--catalog-size", type=int, default=10000)
+    parser.add_argument("--lookups", type=int, default=100)
+    parser.add_argument(
+        "--history", type=int, default=10, help="price history entries per product"
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    logger.remove()
+
+    snapshot = CatalogSnapshot(
+        make_catalog(args.catalog_size, seed=args.seed, history=args.history)
+    )
+    cache.set("all_products", snapshot)
+    app = FastAPI()
+    app.include_router(products_router.router)
+    # The catalog is already cached, no database session is needed
+    app.dependency_overrides[get_session] = lambda: None
+    client = TestClient(app)
+
+    ids = random.Random(args.seed).sample(snapshot.column("id"), args.lookups)
+
+    def single_calls():
+        return [client.get(f"/products/{product_id}").json() for product_id in ids]
+
+    def batch_call():
+        return client.post("/products/batch", json={"ids": ids}).json()["products"]
+
+    assert single_calls() == batch_call()
+    print(f"catalog: {len(snapshot)} products, {args.lookups} lookups")
+    print(f"{'':<24} {'total ms':>10} {'ms/product':>11}")
+    for name, call in (
+        (f"{args.lookups} x GET /{{id}}", single_calls),
+        ("1 x POST /batch", batch_call),
+    ):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - start)
+        total = statistics.median(times)
+        print(f"{name:<24} {total * 1000:10.1f} {total * 1000 / args.lookups:11.3f}")
+
+    print()
+    print(f"{'GET /products/?limit=100':<32} {'KiB':>8} {'ms':>8}")
+    for name, params in (
+        ("all fields (exclude=)", {"exclude": ""}),
+        ("slim default", {}),
+        ("fields=id,name,price", {"fields": "id,name,price"}),
+    ):
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            response = client.get("/products/", params={"limit": 100, **params})
+            times.append(time.perf_counter() - start)
+        print(
+            f"{name:<32} {len(response.content) / 1024:8.1f}"
+            f" {statistics.median(times) * 1000:8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
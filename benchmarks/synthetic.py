@@ -0,0 +1,215 @@
+"""Synthetic Mercadona-like catalog used by the benchmarks."""
+
+import random
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional
+
+import unidecode
+
+from app.models import (
+    Category,
+    NutritionalInformation,
+    PriceHistory,
+    Product,
+    ProductImage,
+)
+
+NOUNS = [
+    "leche",
+    "yogur",
+    "queso",
+    "pan",
+    "galletas",
+    "café",
+    "té",
+    "aceite",
+    "arroz",
+    "pasta",
+    "atún",
+    "jamón",
+    "pechuga",
+    "huevos",
+    "zumo",
+    "agua",
+    "cerveza",
+    "vino",
+    "chocolate",
+    "cereales",
+    "mantequilla",
+    "tomate",
+    "plátano",
+    "manzana",
+    "patatas",
+    "lechuga",
+    "salmón",
+    "merluza",
+    "detergente",
+    "champú",
+]
+QUALIFIERS = [
+    "semidesnatada",
+    "desnatada",
+    "entera",
+    "natural",
+    "integral",
+    "ecológico",
+    "sin lactosa",
+    "sin gluten",
+    "light",
+    "clásico",
+    "curado",
+    "tierno",
+    "en aceite de oliva",
+    "al punto de sal",
+    "con cacao",
+    "de barra",
+    "rallado",
+    "en lonchas",
+    "extra",
+    "fresco",
+    "congelado",
+    "picante",
+    "suave",
+    "intenso",
+]
+BRANDS = [
+    "Hacendado",
+    "Deliplus",
+    "Bosque Verde",
+    "Compy",
+    "Central Lechera Asturiana",
+    "Pascual",
+    "Calvo",
+    "ElPozo",
+    "Casa Tarradellas",
+    "Danone",
+]
+SIZES = ["250 g", "500 g", "1 kg", "1 L", "6 x 1 L", "4 x 125 g", "750 ml", "2 L"]
+
+
+def make_catalog(size: int, seed: int = 0, history: int = 0) -> List[Product]:
+    """
+    Build `size` detached products with categories attached. With `history`,
+    products also get images, nutritional information and `history` weekly
+    price history entries, like the ones loaded by `get_all_products`.
+    """
+    rng = random.Random(seed)
+    details_rng = random.Random(seed + 1)
+    categories = [Category(id=i, name=f"Category {i}") for i in range(1, 41)]
+    products = []
+    for i in range(size):
+        category = rng.choice(categories)
+        name = " ".join(
+            [
+                rng.choice(NOUNS).capitalize(),
+                *rng.sample(QUALIFIERS, rng.randint(0, 2)),
+                rng.choice(BRANDS),
+                rng.choice(SIZES),
+            ]
+        )
+        products.append(
+            Product(
+                id=str(10000 + i),
+                ean=f"84{i:011d}",
+                slug=name.lower().replace(" ", "-"),
+                brand=None,
+                name=name,
+                price=round(rng.uniform(0.3, 25.0), 2),
+                category_id=category.id,
+                category=category,
+                description=None,
+                origin=None,
+                packaging=None,
+                unit_name=None,
+                unit_size=None,
+            )
+        )
+        if history:
+            add_details(products[-1], i, history, details_rng)
+    return products
+
+
+def add_details(product: Product, i: int, history: int, rng: random.Random):
+    """Attach images, nutritional information and price history to a product."""
+    product.images = [
+        ProductImage(
+            id=i * 2 + perspective,
+            product_id=product.id,
+            zoom_url=f"https://example.com/{product.id}/{perspective}/zoom.jpg",
+            regular_url=f"https://example.com/{product.id}/{perspective}.jpg",
+            thumbnail_url=f"https://example.com/{product.id}/{perspective}/thumb.jpg",
+            perspective=perspective,
+        )
+        for perspective in range(2)
+    ]
+    product.nutritional_information = NutritionalInformation(
+        id=i,
+        product_id=product.id,
+        calories=round(rng.uniform(0, 900), 1),
+        total_fat=round(rng.uniform(0, 100), 1),
+        saturated_fat=None,
+        polyunsaturated_fat=None,
+        monounsaturated_fat=None,
+        trans_fat=None,
+        total_carbohydrate=round(rng.uniform(0, 100), 1),
+        dietary_fiber=None,
+        total_sugars=round(rng.uniform(0, 50), 1),
+        protein=round(rng.uniform(0, 40), 1),
+        salt=round(rng.uniform(0, 3), 2),
+    )
+    product.price_history = [
+        PriceHistory(
+            id=i * history + week,
+            product_id=product.id,
+            price=round(product.price * rng.uniform(0.9, 1.1), 2),
+            timestamp=datetime(2024, 1, 1) + timedelta(weeks=week),
+        )
+        for week in range(history)
+    ]
+
+
+class ReceiptQuery(NamedTuple):
+    """A noisy ticket line and the catalog product it was generated from."""
+
+    name: Optional[str]
+    price: Optional[float]
+    product_id: str
+
+
+def abbreviate(token: str, rng: random.Random) -> str:
+    """Receipt-style abbreviation: keep a prefix, or drop the inner vowels."""
+    if len(token) <= 4:
+        return token
+    if rng.random() < 0.5:
+        return token[: rng.randint(3, 5)]
+    return token[0] + "".join(c for c in token[1:] if c not in "aeiou")
+
+
+def receipt_line(name: str, rng: random.Random, max_length: int = 24) -> str:
+    """Turn a catalog name into a ticket line as printed on Mercadona receipts."""
+    tokens = unidecode.unidecode(name).upper().split()
+    if len(tokens) > 2 and rng.random() < 0.5:
+        # Sizes are often missing from ticket lines
+        tokens = tokens[:-2]
+    tokens = [
+        abbreviate(token, rng) if rng.random() < 0.4 else token for token in tokens
+    ]
+    return " ".join(tokens)[: rng.randint(max_length // 2, max_length)].strip()
+
+
+def make_receipt_queries(
+    products: List[Product], count: int, seed: int = 0, price_jitter: float = 0.05
+) -> List[ReceiptQuery]:
+    """
+    Sample `count` noisy ticket lines: truncated, abbreviated, without accents and
+    with the price off by up to `price_jitter`.
+    """
+    rng = random.Random(seed)
+    return [
+        ReceiptQuery(
+            receipt_line(product.name, rng),
+            round(product.price * rng.uniform(1 - price_jitter, 1 + price_jitter), 2),
+            product.id,
+        )
+        for product in rng.choices(products, k=count)
+    ]
@@ -1,5 +1,6 @@
 import asyncio
 import os
+from datetime import datetime
 
 import click
 from loguru import logger
@@ -8,6 +9,7 @@ from sqlalchemy.orm import joinedload
 
 from app.database import get_engine
 from app.parser import parse_mercadona
+from app.shared.fulltext import rebuild_product_fts
 from app.models import Product, NutritionalInformation, is_food_category
 from app.ai.nutrition_facts import NutritionFactsExtractor
 from app.ai.nutrition_estimator import estimate_nutritional_info
@@ -33,6 +35,14 @@ def parse(max_requests, update_existing=False):
     logger.info("Parsing completed")
 
 
+@cli.command()
+def rebuild_search_index():
+    """Rebuild the full-text product search index from the database."""
+    with Session(get_engine()) as session:
+        count = rebuild_product_fts(session)
+    logger.info(f"Indexed {count} products for full-text search")
+
+
 def clean_numeric(value):
     if isinstance(value, str):
         cleaned = "".join(char for char in value if char.isdigit() or char == ".")
@@ -109,6 +119,7 @@ def process_nutritional_information(reprocess_all):
                         for key, value in nutritional_info.items()
                     }
 
+                    product.updated_at = datetime.utcnow()
                     existing_info = product.nutritional_information
                     if existing_info:
                         for key, value in cleaned_info.items():
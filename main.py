@@ -1,12 +1,14 @@
 import sys
 import time
+from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import RedirectResponse
 from loguru import logger
 
-from app.routers import products, categories, ticket, reports
+from app.routers import products, categories, ticket, reports, health
+from app.shared.cache import warm_up
 
 # Configure loguru
 logger.remove()
@@ -14,7 +16,15 @@ logger.add(
     sys.stdout, colorize=True, format="<green>{time}</green> <level>{message}</level>"
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the catalog before the first request needs it
+    warm_up()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # API router
 api_router = FastAPI()
@@ -35,6 +45,7 @@ api_router.include_router(products.router)
 api_router.include_router(categories.router)
 api_router.include_router(ticket.router)
 api_router.include_router(reports.router)
+api_router.include_router(health.router)
 
 # Mount the API router
 app.mount("/api", api_router)
@@ -0,0 +1,44 @@
+"""Add product updated_at
+
+Revision ID: 5e2b8c4a1f03
+Revises: 3c1f6a9d2b7e
+Create Date: 2026-10-16 23:52:41.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "5e2b8c4a1f03"
+down_revision: Union[str, None] = "3c1f6a9d2b7e"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite can't add a column with a non-constant default, existing products
+    # get the epoch and are all part of the first catalog load anyway. SQLite
+    # compares datetimes as text, the default must have the microseconds of the
+    # values SQLAlchemy binds
+    op.add_column(
+        "product",
+        sa.Column(
+            "updated_at",
+            sa.DateTime(),
+            nullable=False,
+            server_default="1970-01-01 00:00:00.000000",
+        ),
+    )
+    op.create_index(
+        op.f("ix_product_updated_at"), "product", ["updated_at"], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_product_updated_at"), table_name="product")
+    with op.batch_alter_table("product") as batch_op:
+        batch_op.drop_column("updated_at")
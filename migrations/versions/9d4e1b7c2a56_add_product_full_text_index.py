@@ -0,0 +1,38 @@
+"""Add product full-text index
+
+Revision ID: 9d4e1b7c2a56
+Revises: 5e2b8c4a1f03
+Create Date: 2026-10-17 00:31:08.524913
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "9d4e1b7c2a56"
+down_revision: Union[str, None] = "5e2b8c4a1f03"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS product_fts"
+        " USING fts5(id UNINDEXED, name, brand, description, category, prefix='2 3')"
+    )
+    # The app folds the indexed text with unidecode; the unicode61 tokenizer
+    # already folds case and accents alike, `cli.py rebuild-search-index`
+    # refolds it exactly
+    op.execute(
+        "INSERT INTO product_fts (id, name, brand, description, category)"
+        " SELECT product.id, product.name, coalesce(product.brand, ''),"
+        " coalesce(product.description, ''), coalesce(category.name, '')"
+        " FROM product LEFT JOIN category ON category.id = product.category_id"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS product_fts")
@@ -0,0 +1,70 @@
+"""Add match confirmations
+
+Revision ID: b7f3a1c9e4d2
+Revises: 9d4e1b7c2a56
+Create Date: 2026-10-17 01:42:19.307516
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b7f3a1c9e4d2"
+down_revision: Union[str, None] = "9d4e1b7c2a56"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "matchconfirmation",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("product_id", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("source", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["product_id"],
+            ["product.id"],
+        ),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name", "source"),
+    )
+    op.create_index(
+        op.f("ix_matchconfirmation_name"),
+        "matchconfirmation",
+        ["name"],
+        unique=False,
+    )
+    # Every existing alias came from a single confirmation of unknown source,
+    # too few to be trusted until reviewed or confirmed again
+    op.execute(
+        "INSERT INTO matchconfirmation (name, product_id, source, created_at)"
+        " SELECT name, product_id, 'legacy', created_at FROM matchalias"
+    )
+    op.add_column(
+        "matchalias",
+        sa.Column("confirmations", sa.Integer(), nullable=False, server_default="1"),
+    )
+    op.add_column(
+        "matchalias",
+        sa.Column(
+            "status",
+            sqlmodel.sql.sqltypes.AutoString(),
+            nullable=False,
+            server_default="pending",
+        ),
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("matchalias") as batch_op:
+        batch_op.drop_column("status")
+        batch_op.drop_column("confirmations")
+    op.drop_index(op.f("ix_matchconfirmation_name"), table_name="matchconfirmation")
+    op.drop_table("matchconfirmation")
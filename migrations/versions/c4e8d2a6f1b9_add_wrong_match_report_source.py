@@ -0,0 +1,33 @@
+"""Add wrong match report source
+
+Revision ID: c4e8d2a6f1b9
+Revises: b7f3a1c9e4d2
+Create Date: 2026-10-17 02:31:47.118204
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision: str = "c4e8d2a6f1b9"
+down_revision: Union[str, None] = "b7f3a1c9e4d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing reports have no known source, they count as a single one
+    op.add_column(
+        "wrongmatchreport",
+        sa.Column("source", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("wrongmatchreport") as batch_op:
+        batch_op.drop_column("source")
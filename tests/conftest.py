@@ -4,6 +4,7 @@ from sqlmodel import SQLModel, Session, create_engine
 from main import api_router
 from app.database import get_session
 from app.models import Product, Category, ProductImage, NutritionalInformation
+from app.shared.cache import cache, json_cache
 
 
 @pytest.fixture(name="engine")
@@ -16,6 +17,14 @@ def engine_fixture():
     SQLModel.metadata.drop_all(engine)
 
 
+@pytest.fixture(autouse=True)
+def clear_cache():
+    # The catalog and categories are cached globally, across tests
+    yield
+    cache.clear()
+    json_cache.clear()
+
+
 @pytest.fixture(name="session")
 def session_fixture(engine):
     connection = engine.connect()
@@ -0,0 +1,126 @@
+from starlette.requests import Request
+
+from app.models import WrongMatchReport
+from app.shared.aliases import (
+    ALIAS_MIN_CONFIRMATIONS,
+    AliasTable,
+    client_address,
+    client_source,
+    confirm_alias,
+)
+from app.shared.cache import load_products
+from app.shared.product_matcher import ProductIndex
+
+
+def test_alias_needs_distinct_sources(session, test_data):
+    table = AliasTable()
+    for _ in range(ALIAS_MIN_CONFIRMATIONS):
+        alias = confirm_alias(session, "MANZANA GOLDEN", "1", "same client")
+    table.refresh(session)
+    assert alias.confirmations == 1
+    assert table.aliases == {}
+
+    for source in range(1, ALIAS_MIN_CONFIRMATIONS):
+        alias = confirm_alias(session, "Manzana golden", "1", f"client {source}")
+    table.refresh(session)
+    assert alias.confirmations == ALIAS_MIN_CONFIRMATIONS
+    assert table.aliases == {"manzana golden": "1"}
+
+
+def test_alias_follows_most_confirmed_product(session, test_data):
+    table = AliasTable()
+    for source in range(ALIAS_MIN_CONFIRMATIONS):
+        confirm_alias(session, "platano", "2", f"client {source}")
+    table.refresh(session)
+    assert table.aliases == {"platano": "2"}
+
+    # A client changing its mind moves its single confirmation
+    alias = confirm_alias(session, "platano", "3", "client 0")
+    assert (alias.product_id, alias.confirmations) == ("2", 2)
+    table.refresh(session)
+    assert table.aliases == {}
+
+    for source in range(1, 3):
+        alias = confirm_alias(session, "platano", "3", f"client {source}")
+    assert (alias.product_id, alias.confirmations) == ("3", 3)
+    table.refresh(session)
+    assert table.aliases == {"platano": "3"}
+
+
+def test_reviewed_alias_keeps_its_product(session, test_data):
+    table = AliasTable()
+    alias = confirm_alias(session, "zanahoria", "3", "client 0")
+    alias.status = "reviewed"
+    session.add(alias)
+    session.commit()
+    for source in range(1, ALIAS_MIN_CONFIRMATIONS + 2):
+        alias = confirm_alias(session, "zanahoria", "1", f"client {source}")
+    assert (alias.product_id, alias.confirmations) == ("3", 1)
+    table.refresh(session)
+    assert table.aliases == {"zanahoria": "3"}
+
+    alias.status = "rejected"
+    session.add(alias)
+    session.commit()
+    table.refresh(session)
+    assert table.aliases == {}
+
+
+def test_wrong_matches_need_corroboration(session, test_data):
+    index = ProductIndex(load_products(session))
+    table = AliasTable()
+    reports = [
+        WrongMatchReport(
+            original_name="BANANA CANARIAS",
+            original_price=1.2,
+            wrong_match_id="2",
+            source=f"client {source}",
+        )
+        for source in range(ALIAS_MIN_CONFIRMATIONS)
+    ]
+    session.add_all(reports[1:] + [reports[1].model_copy(update={"id": None})])
+    session.commit()
+    assert table.refresh(session) == 0
+    assert table.resolve(index, "Banana canarias") == (None, set())
+
+    session.add(reports[0])
+    session.commit()
+    assert table.refresh(session) == 1
+    assert table.resolve(index, "Banana canarias") == (None, {index.positions["2"]})
+
+    for report in reports[1:]:
+        report.status = "rejected"
+        session.add(report)
+    reports[0].status = "reviewed"
+    session.add(reports[0])
+    session.commit()
+    assert table.refresh(session) == 0
+    assert table.resolve(index, "Banana canarias") == (None, {index.positions["2"]})
+
+    reports[0].status = "rejected"
+    session.add(reports[0])
+    session.commit()
+    assert table.refresh(session) == 1
+    assert table.resolve(index, "Banana canarias") == (None, set())
+
+
+def make_request(host: str, forwarded_for: str = "") -> Request:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())] if forwarded_for else []
+    return Request(
+        {"type": "http", "method": "POST", "client": (host, 1234), "headers": headers}
+    )
+
+
+def test_client_source():
+    assert client_address(make_request("203.0.113.7", "198.51.100.1")) == (
+        "203.0.113.7"
+    )
+    # Only the hops added by trusted proxies are skipped
+    request = make_request("127.0.0.1", "198.51.100.1, 203.0.113.7, 127.0.0.1")
+    assert client_address(request) == "203.0.113.7"
+    assert client_address(make_request("127.0.0.1")) == "127.0.0.1"
+
+    source = client_source(make_request("127.0.0.1", "203.0.113.7"))
+    assert source == client_source(make_request("203.0.113.7"))
+    assert source != client_source(make_request("203.0.113.8"))
+    assert "203.0.113.7" not in source
@@ -0,0 +1,182 @@
+import threading
+import time
+
+from app.shared.cache import Cache
+
+
+def test_lru_eviction():
+    cache = Cache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hits_are_lock_free():
+    cache = Cache(maxsize=2)
+    cache.set("a", 1)
+    results = []
+    with cache.lock:
+        reader = threading.Thread(target=lambda: results.append(cache.get("a")))
+        reader.start()
+        reader.join(timeout=5)
+    assert results == [1]
+
+
+def test_ttl_expiry():
+    cache = Cache()
+    cache.set("a", 1, ttl=0)
+    cache.set("b", 2)
+    assert cache.peek("a") == 1
+    assert cache.get("a") is None
+    assert cache.peek("a") is None
+    assert cache.get("b") == 2
+    assert cache.stats()["expirations"] == 1
+
+    # An expired entry is loaded again, without refresh
+    assert cache.get_or_load("b", lambda: 3, ttl=0) == 2
+    cache.delete("b")
+    assert cache.get_or_load("b", lambda: 3, ttl=0) == 3
+    assert cache.get_or_load("b", lambda: 4) == 4
+
+
+def test_single_flight_load():
+    cache = Cache()
+    loads = []
+    start = threading.Barrier(40)
+
+    def load():
+        loads.append(threading.get_ident())
+        time.sleep(0.05)
+        return "value"
+
+    def get():
+        start.wait()
+        results.append(cache.get_or_load("key", load))
+
+    results: list = []
+    threads = [threading.Thread(target=get) for _ in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(loads) == 1
+    assert results == ["value"] * 40
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_stale_while_revalidate():
+    cache = Cache()
+    cache.set("key", "stale", ttl=0)
+    refreshes = []
+    release = threading.Event()
+
+    def refresh():
+        refreshes.append(threading.get_ident())
+        release.wait(5)
+        return "fresh"
+
+    def load():
+        raise AssertionError("Expired values are refreshed, not loaded")
+
+    results: list = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(
+                cache.get_or_load("key", load, refresh=refresh)
+            )
+        )
+        for _ in range(20)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == ["stale"] * 20
+
+    release.set()
+    wait_for(lambda: cache.peek("key") == "fresh")
+    assert len(refreshes) == 1
+    assert cache.get_or_load("key", load, refresh=refresh) == "fresh"
+    assert cache.stats()["stale_hits"] == 20
+
+
+def test_failed_refresh_keeps_stale_value():
+    cache = Cache()
+    cache.set("key", "stale", ttl=0)
+    attempts = []
+
+    def refresh():
+        attempts.append(1)
+        raise RuntimeError("database is down")
+
+    assert cache.get_or_load("key", lambda: "loaded", refresh=refresh) == "stale"
+    wait_for(lambda: not cache.refreshing)
+    assert cache.peek("key") == "stale"
+
+    # The next lookup retries
+    assert cache.get_or_load("key", lambda: "loaded", refresh=refresh) == "stale"
+    wait_for(lambda: not cache.refreshing)
+    assert len(attempts) == 2
+
+
+def test_weighted_eviction():
+    cache = Cache(timeout=float("inf"), maxsize=10, weigher=len)
+    cache.set("a", b"12345")
+    cache.set("b", b"12345")
+    cache.set("c", b"123")
+
+    assert cache.get("a") is None
+    assert cache.weight == 8
+    # An entry heavier than maxsize is still kept
+    cache.set("d", b"x" * 20)
+    assert cache.get("d") == b"x" * 20
+    assert cache.weight == 20
+
+
+def test_concurrent_hits_and_evictions():
+    cache = Cache(timeout=float("inf"), maxsize=64)
+    errors = []
+    stop = threading.Event()
+
+    def read():
+        try:
+            while not stop.is_set():
+                for key in range(128):
+                    cache.get(key)
+        except Exception as e:
+            errors.append(e)
+
+    def write():
+        try:
+            for _ in range(200):
+                for key in range(128):
+                    cache.set(key, key)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    writers = [threading.Thread(target=write) for _ in range(2)]
+    for thread in readers + writers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert len(cache.data) == 64
+    assert cache.weight == 64
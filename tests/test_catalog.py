@@ -0,0 +1,119 @@
+from datetime import datetime
+
+from app.models import Product
+from app.shared import cache
+from app.shared.catalog import (
+    CatalogSnapshot,
+    open_snapshot,
+    snapshot_generation,
+    write_snapshot,
+)
+from benchmarks.synthetic import make_catalog
+
+
+def shared_ean_catalog() -> CatalogSnapshot:
+    catalog = make_catalog(6)
+    catalog[1].ean = catalog[4].ean = "8400000000999"
+    products = CatalogSnapshot(catalog)
+    products.index("id")
+    products.index("ean")
+    return products
+
+
+def test_update_keeps_shared_ean():
+    products = shared_ean_catalog()
+    assert products.find_ean("8400000000999") == 1
+
+    # The product not holding the indexed entry changes its EAN
+    products[4] = products[4].model_copy(update={"ean": "8400000000777"})
+    assert products.find_ean("8400000000999") == 1
+    assert products.find_ean("8400000000777") == 4
+
+    # The holder changes its EAN, the entry moves to the other product
+    products[4] = products[4].model_copy(update={"ean": "8400000000999"})
+    products[1] = products[1].model_copy(update={"ean": "8400000000888"})
+    assert products.find_ean("8400000000999") == 4
+    assert products.find_ean("8400000000888") == 1
+
+    products[4] = products[4].model_copy(update={"ean": "8400000000666"})
+    assert products.find_ean("8400000000999") is None
+
+
+def test_update_indexes_first_position():
+    products = shared_ean_catalog()
+    ean = products[3].ean
+    products[0] = products[0].model_copy(update={"ean": ean})
+
+    assert products.find_ean(ean) == 0
+    assert products.find(products[0].id) == 0
+
+
+def test_append_and_find():
+    products = shared_ean_catalog()
+    new = products[2].model_copy(update={"id": "new", "ean": "8400000000555"})
+    products.append(new)
+
+    assert products.find("new") == 6
+    assert products.find_ean("8400000000555") == 6
+    assert products.find_ean("8400000000999") == 1
+
+
+def test_patch_with_views():
+    products = shared_ean_catalog()
+    changed = [
+        products[2].model_copy(update={"name": "Renamed", "price": 9.5}),
+        products[3].model_copy(update={"id": "new", "ean": "8400000000555"}),
+    ]
+    views = CatalogSnapshot(changed).views()
+    products[2] = views[0]
+    products.append(views[1])
+
+    assert products[2].name == "Renamed"
+    assert products.prices[2] == 9.5
+    assert products.find("new") == 6
+    assert products.find_ean("8400000000555") == 6
+    assert products.row(6, ["id", "name"]) == {"id": "new", "name": changed[1].name}
+    assert products[6].updated_at == changed[1].updated_at
+
+
+def test_snapshot_file_round_trip(tmp_path):
+    path = str(tmp_path / "catalog.snapshot")
+    products = CatalogSnapshot(make_catalog(20))
+    mapped = write_snapshot(products, path)
+    assert mapped is not None
+    assert mapped.generation == snapshot_generation(path) == 1
+    assert len(mapped) == len(products)
+    assert mapped.version == products.version
+    for position in (0, 7, 19):
+        assert mapped.row(position) == products.row(position)
+    assert open_snapshot(3600, path).version == products.version
+    assert write_snapshot(products, path).generation == 2
+
+    # Too old
+    assert open_snapshot(-1, path) is None
+    with open(path, "rb") as file:
+        data = file.read()
+    for corrupt in (data[: len(data) // 2], b"garbage" + data[7:], b""):
+        with open(path, "wb") as file:
+            file.write(corrupt)
+        assert open_snapshot(3600, path) is None
+    assert open_snapshot(3600, str(tmp_path / "missing")) is None
+
+
+def test_outdated_snapshot_is_reloaded(session, test_data, tmp_path, monkeypatch):
+    path = str(tmp_path / "catalog.snapshot")
+    monkeypatch.setattr(
+        cache, "open_snapshot", lambda max_age: open_snapshot(max_age, path)
+    )
+    monkeypatch.setattr(cache, "write_snapshot", lambda s: write_snapshot(s, path))
+    assert cache.load_catalog(session).generation == 1
+    assert cache.load_catalog(session).generation == 1
+
+    apple = session.get(Product, "1")
+    apple.name = "Green apple"
+    apple.updated_at = datetime.utcnow()
+    session.add(apple)
+    session.commit()
+    products = cache.load_catalog(session)
+    assert products.generation == 2
+    assert products[products.find("1")].name == "Green apple"
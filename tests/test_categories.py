@@ -0,0 +1,31 @@
+from app.models import Category
+
+
+def test_category_pages(client, test_data):
+    test_data.add_all(Category(id=i, name=f"Category {i}") for i in range(3, 12))
+    test_data.commit()
+    ids, cursor = [], None
+    while True:
+        params = {"limit": 4} if cursor is None else {"limit": 4, "cursor": cursor}
+        response = client.get("/categories/", params=params)
+        ids += [category["id"] for category in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert ids == list(range(1, 12))
+    response = client.get("/categories/", params={"skip": 2, "limit": 3})
+    assert [category["id"] for category in response.json()] == [3, 4, 5]
+
+
+def test_categories_not_modified(client, test_data):
+    response = client.get("/categories/")
+    assert [category["name"] for category in response.json()] == [
+        "Fruits",
+        "Vegetables",
+    ]
+    etag = response.headers["etag"]
+    response = client.get("/categories/", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    response = client.get("/categories/", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
@@ -0,0 +1,14 @@
+from app.shared.cache import products_ready
+
+
+def test_ready_once_catalog_loaded(client, test_data):
+    products_ready.clear()
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json()["status"] == "loading"
+
+    client.get("/products/")
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json()["status"] == "ready"
+    assert response.json()["memory"]["products"] == 3
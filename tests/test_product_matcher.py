@@ -0,0 +1,271 @@
+import multiprocessing
+from datetime import datetime
+
+import billiard
+import numpy as np
+
+from app.models import Product
+from app.shared import matching
+from app.shared.cache import cache, get_all_products, load_products
+from app.shared import product_matcher
+from app.shared.catalog import CatalogSnapshot, ProductView
+from app.shared.index_refresh import IndexRefresher
+from app.shared.product_matcher import (
+    MIN_CANDIDATE_SCORE,
+    ProductIndex,
+    default_engine,
+    score_closest_products,
+)
+from app.shared.sharded_matcher import ShardedMatcher
+from app.shared.tfidf_matcher import TfidfMatcher
+from benchmarks.synthetic import make_catalog, make_receipt_queries
+
+
+def assert_same_index(index: ProductIndex, fresh: ProductIndex):
+    assert index.ids == fresh.ids
+    assert index.names == fresh.names
+    assert index.tokens == fresh.tokens
+    assert index.prices == fresh.prices
+    assert index.positions == fresh.positions
+    assert list(index.sorted_prices) == list(fresh.sorted_prices)
+    assert sorted(index.price_order) == sorted(fresh.price_order)
+    assert np.array_equal(index.price_array, fresh.price_array)
+    assert {gram: p for gram, p in index.postings.items() if p} == {
+        gram: p for gram, p in fresh.postings.items() if p
+    }
+
+
+def changed_catalog(products):
+    """Copies of a few renamed and repriced products, plus new products."""
+    changed = [
+        product.model_copy(update={"name": f"Renamed {product.name}", "price": 9.99})
+        for product in products[:200:20]
+    ]
+    added = [
+        product.model_copy(update={"id": f"new-{product.id}"})
+        for product in make_catalog(5, seed=1)
+    ]
+    return changed, added
+
+
+def test_update_matches_fresh_index():
+    products = make_catalog(500)
+    index = ProductIndex(products)
+    changed, added = changed_catalog(products)
+    index.update(changed + added)
+
+    expected = list(products)
+    for product in changed:
+        expected[index.positions[product.id]] = product
+    assert_same_index(index, ProductIndex(expected + added))
+
+    for product in changed + added:
+        ((_, position),) = score_closest_products(
+            index, product.name, product.price, threshold=0, max_matches=1
+        )
+        assert index.ids[position] == product.id
+
+
+def test_changed_since():
+    products = make_catalog(100)
+    index = ProductIndex(products)
+    first = index.generation
+    changed, added = changed_catalog(products)
+    index.update(changed)
+    second = index.generation
+    index.update(added)
+
+    assert index.changed_since(index.generation) == []
+    assert index.changed_since(second) == [100, 101, 102, 103, 104]
+    assert index.changed_since(first) == [
+        *sorted(index.positions[p.id] for p in changed),
+        100,
+        101,
+        102,
+        103,
+        104,
+    ]
+    assert index.changed_since(ProductIndex(products).generation) is None
+    assert index.changed_since(None) is None
+
+
+def test_changed_since_forgets_old_updates(monkeypatch):
+    monkeypatch.setattr(product_matcher, "MAX_INDEX_HISTORY", 2)
+    products = make_catalog(10)
+    index = ProductIndex(products)
+    generations = [index.generation]
+    for product in products[:4]:
+        index.update([product.model_copy(update={"price": 9.99})])
+        generations.append(index.generation)
+
+    assert len(index.history) == 2
+    assert index.changed_since(generations[2]) == [2, 3]
+    assert index.changed_since(generations[3]) == [3]
+    assert index.changed_since(generations[1]) is None
+    assert index.changed_since(generations[0]) is None
+
+
+def test_prefilter_matches_full_scan():
+    products = make_catalog(2000)
+    index = ProductIndex(products)
+    agree = unguarded_agree = 0
+    for query in make_receipt_queries(products, 100, seed=1):
+        args = (index, query.name, query.price, 60.0, 5)
+        full = score_closest_products(*args, min_candidates=len(index) + 1)
+        # Few candidates, for the prefilter to miss good matches
+        prefiltered = score_closest_products(*args, max_candidates=50)
+        unguarded = score_closest_products(
+            *args, max_candidates=50, min_candidate_score=0
+        )
+        if not prefiltered or prefiltered[0][0] < MIN_CANDIDATE_SCORE:
+            # The rest of the catalog was scanned
+            assert prefiltered == full
+        agree += prefiltered[:1] == full[:1]
+        unguarded_agree += unguarded[:1] == full[:1]
+    assert agree >= 98
+    assert agree > unguarded_agree
+
+
+def test_tfidf_reranks_on_the_fuzzy_scale():
+    products = make_catalog(2000)
+    index = ProductIndex(products)
+    queries = make_receipt_queries(products, 50, seed=1)
+    scored_batch = TfidfMatcher().score(
+        index, [(query.name, query.price) for query in queries], 60.0, 5
+    )
+    agree = sum(
+        scored[:1]
+        == score_closest_products(
+            index, query.name, query.price, 60.0, 5, min_candidates=len(index) + 1
+        )[:1]
+        for query, scored in zip(queries, scored_batch)
+    )
+    assert agree >= 48
+
+
+def test_tfidf_matrix_update():
+    products = make_catalog(300)
+    index = ProductIndex(products)
+    matcher = TfidfMatcher(rerank=0)
+    matcher.load(index)
+    renamed = products[7].model_copy(update={"name": "Zumo exotico de pitahaya"})
+    added = products[8].model_copy(update={"id": "new", "name": "Kombucha de jengibre"})
+    index.update([renamed, added])
+    matrix = matcher.load(index)
+
+    assert matrix.size == len(index)
+    assert sorted(matrix.patched) == [7, 300]
+    for name, position in (
+        ("zumo pitahaya", 7),
+        ("kombucha jengibre", 300),
+        (products[7].name, None),
+    ):
+        (scored,) = matcher.score(index, [(name, None)], 0, 1)
+        if position is None:
+            assert scored[0][1] != 7
+        else:
+            assert scored[0][1] == position
+
+
+# Matcher and index of the test, inherited by the forked pool processes
+_pool_matcher = None
+
+
+def _match_in_pool(items, changed=()):
+    matcher, index = _pool_matcher
+    assert multiprocessing.current_process().daemon
+    # Worker processes refresh their own copy of the index
+    if changed:
+        index.update(changed)
+    return ids_and_scores(matcher.match_batch(index, items, 0, 3)), [
+        ids_and_scores([matcher.match(index, name, price, 0, 3)])[0]
+        for name, price in items
+    ]
+
+
+def ids_and_scores(results):
+    return [[(m.product.id, m.score) for m in matches] for matches in results]
+
+
+def test_sharded_matcher_from_pool_processes():
+    global _pool_matcher
+    products = make_catalog(300)
+    index = ProductIndex(products)
+    items = [(product.name, product.price) for product in products[:300:30]]
+    expected = ids_and_scores(default_engine.match_batch(index, items, 0, 3))
+    matcher = ShardedMatcher(shards=2)
+    _pool_matcher = (matcher, index)
+    try:
+        matcher.load(index)
+        # Celery prefork pool processes are daemonic, like these
+        with billiard.Pool(2) as pool:
+            batch, single = pool.apply(_match_in_pool, (items,))
+            assert batch == expected
+            assert [matches[0] for matches in single] == [
+                matches[0] for matches in expected
+            ]
+
+            # The owner patches the shards, pool processes see the changes
+            changed, added = changed_catalog(products)
+            index.update(changed + added)
+            items = [(product.name, product.price) for product in changed + added]
+            expected = ids_and_scores(default_engine.match_batch(index, items, 0, 3))
+            assert ids_and_scores(matcher.match_batch(index, items, 0, 3)) == expected
+            assert pool.apply(_match_in_pool, (items, changed + added))[0] == expected
+
+            # Without a shard, pool processes fall back to matching themselves
+            dead = matcher.processes[1]
+            dead.kill()
+            dead.join()
+            assert pool.apply(_match_in_pool, (items, changed + added))[0] == expected
+            # and the owner restarts it
+            assert ids_and_scores(matcher.match_batch(index, items, 0, 3)) == expected
+            assert matcher.processes[1] is not dead
+            assert matcher.processes[1].is_alive()
+            assert pool.apply(_match_in_pool, (items, changed + added))[0] == expected
+    finally:
+        _pool_matcher = None
+        matcher.close()
+
+
+def test_refresher_patches_changed_products(session, test_data):
+    index = ProductIndex(CatalogSnapshot(load_products(session)))
+    refresher = IndexRefresher(
+        index, max(product.updated_at for product in index.products)
+    )
+    assert refresher.refresh(session) == 0
+
+    apple = session.get(Product, "1")
+    apple.name = "Green apple"
+    apple.updated_at = datetime.utcnow()
+    session.add(apple)
+    session.commit()
+    generation = index.generation
+
+    assert refresher.refresh(session) == 1
+    position = index.positions["1"]
+    assert index.changed_since(generation) == [position]
+    assert index.names[position] == "green apple"
+    # Changed products are kept as columns, not as ORM objects
+    assert isinstance(index.products.overrides[position], ProductView)
+    assert index.products[position].name == "Green apple"
+    assert index.products.row(position, ["name", "images"])["images"]
+
+
+def test_in_process_index_is_patched(session, test_data, monkeypatch):
+    monkeypatch.setattr(matching, "_refresher", None)
+    index = matching.current_index(session)
+    catalog = get_all_products(session)
+    assert index.products is not catalog
+
+    apple = session.get(Product, "1")
+    apple.name = "Green apple"
+    apple.updated_at = datetime.utcnow()
+    session.add(apple)
+    session.commit()
+    # A catalog reload doesn't rebuild the index, the refresh patches it
+    cache.delete("all_products")
+    matching._refresher.refresh_interval = 0
+    assert matching.current_index(session) is index
+    assert index.names[index.positions["1"]] == "green apple"
+    assert catalog[catalog.find("1")].name == "Apple"
@@ -0,0 +1,224 @@
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import zstandard
+from sqlmodel import select
+
+from app.models import Category, Product
+from app.shared.cache import cache
+from app.shared.catalog import NUTRIENT_FIELDS
+from app.shared.search import SEARCH_SORT_KEYS
+
+
+def add_products(session, count):
+    for i in range(count):
+        session.add(
+            Product(
+                id=f"p{i:03d}",
+                ean=f"84{i:011d}",
+                slug=f"product-{i}",
+                name=f"Product {i % 7}",
+                price=[1.0, 2.5, 0.99][i % 3],
+                category_id=1,
+                updated_at=datetime(2024, 1, 1) + timedelta(seconds=i % 5),
+            )
+        )
+    session.commit()
+
+
+def walk_pages(client, sort, limit):
+    ids, cursor = [], None
+    while True:
+        params = {"sort": sort, "limit": limit, "fields": "id"}
+        if cursor is not None:
+            params["cursor"] = cursor
+        response = client.get("/products/", params=params)
+        assert response.status_code == 200
+        ids += [product["id"] for product in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            return ids
+
+
+def test_cursor_pages_agree(client, test_data):
+    add_products(test_data, 40)
+    products = test_data.exec(select(Product)).unique().all()
+    for sort in ("id", "name", "price", "updated_at"):
+        expected = [
+            p.id for p in sorted(products, key=lambda p: (getattr(p, sort), p.id))
+        ]
+        cache.delete("all_products")
+        for limit in (1, 7, 100):
+            # Read from the database until the catalog is loaded
+            assert walk_pages(client, sort, limit) == expected
+            assert cache.peek("all_products") is None
+        client.get("/products/")
+        for limit in (1, 7, 100):
+            assert walk_pages(client, sort, limit) == expected
+
+    response = client.get("/products/", params={"cursor": "garbage"})
+    assert response.status_code == 400
+
+
+def test_not_modified(client, test_data):
+    response = client.get("/products/1")
+    etag = response.headers["etag"]
+    response = client.get("/products/1", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    response = client.get("/products/", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+    response = client.get("/products/1", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    response = client.get("/products/missing", headers={"If-None-Match": etag})
+    assert response.status_code == 404
+
+
+def test_batch_reports_missing(client, test_data):
+    response = client.post(
+        "/products/batch",
+        params={"fields": "id"},
+        json={"ids": ["2", "missing", "1"], "eans": ["1234567890123", "0"]},
+    )
+    assert response.json() == {
+        "products": [{"id": "2"}, {"id": "1"}, {"id": "1"}],
+        "missing_ids": ["missing"],
+        "missing_eans": ["0"],
+    }
+    response = client.post("/products/batch", json={"ids": ["1"] * 501})
+    assert response.status_code == 422
+
+
+def test_field_projection(client, test_data):
+    response = client.get("/products/1", params={"fields": "id,name"})
+    assert response.json() == {"id": "1", "name": "Apple"}
+    product = client.get("/products/").json()[0]
+    assert "images" in product
+    assert "price_history" not in product
+    product = client.get("/products/", params={"exclude": ""}).json()[0]
+    assert "price_history" in product
+    response = client.get("/products/1", params={"fields": "id,unknown"})
+    assert response.status_code == 400
+
+
+def test_export(client, test_data):
+    add_products(test_data, 10)
+    identity = {"Accept-Encoding": "identity"}
+    response = client.get("/products/export", headers=identity)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert "content-encoding" not in response.headers
+    lines = response.content.splitlines()
+    ids = [json.loads(line)["id"] for line in lines]
+    assert ids == sorted(ids)
+    assert len(ids) == 13
+
+    # The snapshot exports the same lines as the database
+    client.get("/products/")
+    response = client.get("/products/export", headers=identity)
+    assert response.content.splitlines() == lines
+
+    with client.stream(
+        "GET", "/products/export", headers={"Accept-Encoding": "gzip"}
+    ) as response:
+        assert response.headers["content-encoding"] == "gzip"
+        content = b"".join(response.iter_raw())
+    assert gzip.decompress(content).splitlines() == lines
+
+    with client.stream(
+        "GET", "/products/export", headers={"Accept-Encoding": "gzip, zstd"}
+    ) as response:
+        assert response.headers["content-encoding"] == "zstd"
+        content = b"".join(response.iter_raw())
+    reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(content))
+    assert reader.read().splitlines() == lines
+
+
+def test_full_text_search(client, test_data):
+    test_data.add(
+        Product(
+            id="4",
+            ean="4567890123456",
+            slug="cafe",
+            name="Café molido natural",
+            brand="Hacendado",
+            price=3.0,
+            category_id=1,
+        )
+    )
+    test_data.commit()
+    response = client.get("/products/search", params={"q": "CAFE mol", "fields": "id"})
+    assert response.json() == [{"id": "4"}]
+    response = client.get("/products/search", params={"q": "hacen", "fields": "id"})
+    assert response.json() == [{"id": "4"}]
+    response = client.get("/products/search", params={"q": "zzz"})
+    assert response.json() == []
+
+    response = client.get("/products/search", params={"q": "ap", "fields": "id"})
+    assert response.json() == [{"id": "1"}]
+    response = client.get(
+        "/products/search",
+        params={"q": "ap", "fields": "id"},
+        headers={"If-None-Match": response.headers["etag"]},
+    )
+    assert response.status_code == 304
+
+
+def search_ids(client, **params):
+    response = client.get("/products/search", params={"fields": "id", **params})
+    assert response.status_code == 200
+    return [product["id"] for product in response.json()]
+
+
+def test_search_filters_and_sorts(client, test_data):
+    test_data.add_all(
+        [Category(id=30, name="Drugstore"), Category(id=31, name="Soap", parent_id=30)]
+    )
+    test_data.add(
+        Product(
+            id="4",
+            ean="4567890123456",
+            slug="soap",
+            name="Soap",
+            price=2.0,
+            category_id=31,
+        )
+    )
+    test_data.commit()
+
+    assert search_ids(client) == ["2", "3", "1", "4"]
+    assert search_ids(client, order="desc") == ["4", "1", "3", "2"]
+    assert search_ids(client, min_price=0.6, max_price=1.5) == ["3", "1"]
+    assert search_ids(client, skip=1, limit=2) == ["3", "1"]
+
+    # Categories include their subcategories
+    assert search_ids(client, category_id=30) == ["4"]
+    assert search_ids(client, category_id=[2, 31]) == ["3", "4"]
+    assert search_ids(client, is_food=False) == ["4"]
+    assert search_ids(client, is_food=True, category_id=1) == ["2", "1"]
+
+    # Unknown nutrients sort last in both orders
+    assert search_ids(client, sort="calories") == ["1", "2", "3", "4"]
+    assert search_ids(client, sort="calories", order="desc") == ["2", "1", "3", "4"]
+    assert search_ids(client, nutrient="protein>=1") == ["2"]
+    assert search_ids(client, nutrient=["calories>=50", "calories<=60"]) == ["1"]
+    assert search_ids(client, nutrient="calories<=60", sort="calories") == ["1"]
+    assert search_ids(client, q="ap", max_price=0.9) == []
+
+
+def test_search_rejects_invalid_input(client, test_data):
+    response = client.get("/products/search", params={"sort": "name"})
+    assert response.status_code == 422
+    for condition in ("sodium>=1", "protein=1", "protein>=abc"):
+        response = client.get("/products/search", params={"nutrient": condition})
+        assert response.status_code == 400
+    response = client.get("/products/search", params={"category_id": "fruit"})
+    assert response.status_code == 422
+
+    schema = client.get("/openapi.json").json()
+    parameters = schema["paths"]["/products/search"]["get"]["parameters"]
+    sort = next(parameter for parameter in parameters if parameter["name"] == "sort")
+    assert "protein_per_euro" in str(sort["schema"])
+    # Every nutrient can be sorted by
+    assert SEARCH_SORT_KEYS[3:] == NUTRIENT_FIELDS